@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+import rolling
+import simulator
+
+# Portfolio backtests on a dates x symbols price panel. A boolean signal matrix says which symbols may be held;
+# at each rebalance the portfolio is reset to target weights among them, and in between the positions drift with
+# their prices. Holdings are fixed share counts within a rebalance segment, so the equity curve is a handful of
+# gathers over the whole panel instead of a loop over days.
+
+trading_days = 252
+
+
+def forward_fill(values):
+    """Last valid value along axis 0 (NaN before the first one)."""
+    values = np.asarray(values, dtype="f8")
+    rows = np.arange(len(values)).reshape((-1,) + (1,) * (values.ndim - 1))
+    last = np.maximum.accumulate(np.where(np.isnan(values), 0, rows), axis=0)
+
+    return np.take_along_axis(values, last, axis=0)
+
+
+def rebalance_rows(n, rebalance="M", dates=None):
+    """Row numbers of the rebalances: every `rebalance` rows for an int, or the first row and the last row of each
+    period ("D", "W", "M", "Q", "Y") of the dates."""
+    if isinstance(rebalance, int):
+        return np.arange(0, n, rebalance)
+
+    if rebalance == "D":
+        return np.arange(n)
+
+    if dates is None:
+        raise ValueError(f"Rebalancing by \"{rebalance}\" needs the panel dates.")
+
+    periods = pd.DatetimeIndex(dates).to_period(rebalance).asi8
+    ends = np.flatnonzero(periods[1:] != periods[:-1])
+
+    return np.unique(np.concatenate([[0], ends]))
+
+
+def target_weights(signals, prices, sizing="equal", max_positions=None, scores=None, volatility_window=20):
+    """Weights (rows summing to at most 1) among the symbols signalled on each row.
+
+    sizing is "equal" or "inverse_volatility" (of daily returns over volatility_window). With max_positions only the
+    highest scores (the signal order of columns when scores is None) are kept.
+    """
+    prices = np.asarray(prices, dtype="f8")
+    held = np.asarray(signals, dtype=bool) & ~np.isnan(prices)
+
+    if max_positions is not None:
+        scores = np.zeros(prices.shape) if scores is None else np.asarray(scores, dtype="f8")
+        ranked = np.where(held, np.nan_to_num(scores, nan=-np.inf), np.nan)
+        # Rank of each held symbol by score, best first (held symbols sort ahead of the NaNs)
+        order = np.argsort(np.where(np.isnan(ranked), np.inf, -ranked), axis=1, kind="stable")
+        ranks = np.argsort(order, axis=1, kind="stable")
+        held &= ranks < max_positions
+
+    if sizing == "equal":
+        raw = held.astype("f8")
+    elif sizing == "inverse_volatility":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            returns = np.diff(prices, axis=0, prepend=np.nan) / rolling.shift(prices, 1)
+            mean = rolling.rolling_mean(returns, volatility_window)
+            std = np.sqrt(np.maximum(rolling.rolling_mean(returns ** 2, volatility_window) - mean ** 2, 0))
+            raw = np.where(held & (std > 0), 1 / std, 0.0)
+    else:
+        raise ValueError(f"Unknown sizing \"{sizing}\", use \"equal\" or \"inverse_volatility\".")
+
+    totals = raw.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals > 0, raw / totals, 0.0)
+
+
+def backtest(prices, signals, rebalance="M", dates=None, sizing="equal", max_positions=None, scores=None,
+             cost=0.0, volatility_window=20):
+    """Equity curve (starting at 1), daily returns, turnover and drawdown of a portfolio on a dates x symbols panel.
+
+    Weights are set at the close of each rebalance row from that row's signals, and earn the returns of the
+    following rows. cost is charged per unit of turnover (0.001 = 10 bp). Accepts arrays, or DataFrames (whose
+    index gives the dates) for a DataFrame result.
+    """
+    if isinstance(prices, pd.DataFrame):
+        dates = prices.index if dates is None else dates
+        result = backtest(prices.values, np.asarray(signals), rebalance, dates, sizing, max_positions,
+                          None if scores is None else np.asarray(scores), cost, volatility_window)
+        return pd.DataFrame(result, index=prices.index)
+
+    prices = np.asarray(prices, dtype="f8")
+    n = len(prices)
+    if n == 0:
+        return {"equity": np.array([]), "returns": np.array([]), "turnover": np.array([]), "drawdown": np.array([])}
+
+    rows = rebalance_rows(n, rebalance, dates)
+    weights = target_weights(signals, prices, sizing, max_positions, scores, volatility_window)[rows]
+
+    # Delisted or halted symbols are valued at their last price
+    valued = forward_fill(prices)
+
+    # Segment held on each row: the last rebalance strictly before it (-1: all cash)
+    segment = np.searchsorted(rows, np.arange(n), side="left") - 1
+    held = np.clip(segment, 0, None)
+    start_prices = valued[rows][held]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        growth = np.where(weights[held] > 0, valued / start_prices, 0.0)
+    invested = weights[held].sum(axis=1)
+    segment_value = np.where(segment >= 0, (weights[held] * growth).sum(axis=1) + 1 - invested, 1.0)
+
+    # At each rebalance the drifted weights are traded back to target
+    end_value = segment_value[rows]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drifted = np.where(segment[rows, None] >= 0, weights[held[rows]] * growth[rows], 0.0) / end_value[:, None]
+    turnover = np.abs(weights - drifted).sum(axis=1)
+
+    # Equity just after each rebalance; the rows of a segment grow from it, and a rebalance row shows the equity
+    # after trading
+    start_equity = np.cumprod(end_value * (1 - cost * turnover))
+    equity = np.where(segment >= 0, start_equity[held] * segment_value, 1.0)
+    equity[rows] = start_equity
+
+    daily_turnover = np.zeros(n)
+    daily_turnover[rows] = turnover
+
+    return {"equity": equity,
+            "returns": np.diff(equity, prepend=1.0) / np.concatenate([[1.0], equity[:-1]]),
+            "turnover": daily_turnover,
+            "drawdown": equity / np.maximum.accumulate(np.maximum(equity, 1.0)) - 1}
+
+
+def statistics(result):
+    """Headline numbers of a backtest result (dict or DataFrame)."""
+    equity, returns = np.asarray(result["equity"]), np.asarray(result["returns"])
+    years = len(equity) / trading_days
+
+    return {"total return": (equity[-1] - 1) * 100 if len(equity) else np.nan,
+            "cagr": (equity[-1] ** (1 / years) - 1) * 100 if len(equity) else np.nan,
+            "volatility": np.std(returns) * np.sqrt(trading_days) * 100,
+            "sharpe": np.mean(returns) / np.std(returns) * np.sqrt(trading_days) if np.std(returns) > 0 else np.nan,
+            "max drawdown": np.min(result["drawdown"]) * 100 if len(equity) else np.nan,
+            "annual turnover": np.sum(result["turnover"]) / years if len(equity) else np.nan}
+
+
+def ema_signals(prices, fast=simulator.smas_min, slow=simulator.smas_max):
+    """simulator's moving-average position (held or not) for every symbol of a dates x symbols array."""
+    prices = np.asarray(prices, dtype="f8")
+    signal = np.column_stack([simulator.ema_signal(prices[:, i], fast, slow) for i in range(prices.shape[1])])
+
+    return simulator.positions(signal).astype(bool)
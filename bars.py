@@ -0,0 +1,97 @@
+import json
+import os
+
+import pandas as pd
+
+import data_loader
+import price_store
+
+# Resampled bars are materialized next to the daily data in data/{market}/price_history/{timeframe}/. Bins are
+# labelled on the left like data_loader.weekly/monthly, so a stored bar labelled L covers the daily rows after L.
+# When the daily history changes (new bars, or a refresh restating the last one) only the last stored bin (the open
+# period) and anything after it is recomputed. Multi-period rules ("2W", "5D") are binned from the first daily row,
+# so a partial recompute would start at the wrong boundary; they are resampled in full whenever the history changes.
+
+
+def bars_path(symbol, timeframe="W", market="us"):
+    return f"{price_store.price_history_directory(market)}/{timeframe}/{price_store.symbol_filename(symbol)}.npy"
+
+
+def meta_path(symbol, timeframe="W", market="us"):
+    return f"{price_store.price_history_directory(market)}/{timeframe}/{price_store.symbol_filename(symbol)}.json"
+
+
+def _read_meta(symbol, timeframe, market):
+    file_path = meta_path(symbol, timeframe, market)
+
+    if not os.path.isfile(file_path) or not os.path.isfile(bars_path(symbol, timeframe, market)):
+        return None
+
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+def _write(bars, daily, stamp, symbol, timeframe, market):
+    price_store.write_records(price_store.to_records(bars), bars_path(symbol, timeframe, market))
+
+    # The meta is written after the bars, so after a crash it can only be behind, which triggers a recompute.
+    meta = {"first_daily": str(daily.index[0].date()), "last_daily": str(daily.index[-1].date()), "stamp": stamp}
+    tmp_path = f"{meta_path(symbol, timeframe, market)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path(symbol, timeframe, market))
+
+
+def single_period(timeframe):
+    return pd.tseries.frequencies.to_offset(timeframe).n == 1
+
+
+def load_bars(symbol, timeframe="W", market="us"):
+    """Daily ("D"), weekly ("W"), monthly ("M") or any other pandas-rule bars for one symbol."""
+    # Taken before reading, so a write in between leaves the stamp behind and only causes a recompute
+    stamp = price_store.source_stamp(symbol, market)
+    daily = data_loader.load_price_history(symbol, market=market, reload=False)
+
+    if timeframe == "D" or len(daily) == 0:
+        return daily
+
+    meta = _read_meta(symbol, timeframe, market)
+    bars = None
+
+    if meta is not None and meta["first_daily"] == str(daily.index[0].date()) \
+            and meta["last_daily"] <= str(daily.index[-1].date()):
+        bars = price_store.from_records(price_store.read_records(bars_path(symbol, timeframe, market)))
+
+    if bars is not None and len(bars) > 0 and meta.get("stamp") == stamp:
+        return bars
+
+    if bars is None or len(bars) == 0 or not single_period(timeframe):  # nothing usable stored
+        bars = data_loader.resample_bars(daily, timeframe)
+    else:
+        open_period = bars.index[-1]
+        recomputed = data_loader.resample_bars(daily[daily.index > open_period], timeframe)
+        bars = pd.concat([bars[bars.index < open_period], recomputed])
+
+    _write(bars, daily, stamp, symbol, timeframe, market)
+
+    return bars
+
+
+def load_bars_many(symbols, timeframe="W", market="us"):
+    out = {}
+
+    for symbol in data_loader.remove_duplicates(symbols):
+        if price_store.has_price_history(symbol, market):
+            out[symbol] = load_bars(symbol, timeframe, market)
+
+    return out
+
+
+def bars_panel(symbols, timeframe="W", market="us", column="Adj Close"):
+    """One column of the bars of every symbol, aligned on a shared date index."""
+    bars = load_bars_many(symbols, timeframe, market)
+
+    if not bars:
+        return pd.DataFrame()
+
+    return pd.concat({symbol: df[column] for symbol, df in bars.items()}, axis=1, join="outer", sort=True)
@@ -0,0 +1,98 @@
+import argparse
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+import simulator
+
+# Timings of the vectorized code paths against the loops they replaced, on synthetic price histories:
+#
+#     python benchmarks.py --symbols 20 --bars 1500
+
+
+def ema_strategy_loop(df):
+    """simulate_ema_strategy's original per-bar loop, kept as the reference for the vectorized version."""
+    df = df.copy()
+    smas_min = [3, 5, 8, 10, 12, 15]
+    smas_max = [30, 35, 40, 45, 50, 60]
+    smas_used = smas_min + smas_max
+    len_cols = len(df.columns)
+
+    for sma in smas_used:
+        df[f"ema_{sma}"] = np.round(df.loc[:, "Adj Close"].rolling(window=sma).mean(), 2)
+    pos = 0
+    num = 0
+    percent_change = []
+    bp = 0
+    for i in range(len(df)):
+        c_min = np.min(df.iloc[i, len_cols:len_cols + len(smas_min)])
+        c_max = np.max(df.iloc[i, len_cols + len(smas_min):len_cols + len(smas_min) + len(smas_max)])
+        close = df["Adj Close"].iloc[i]
+        if c_min > c_max:
+            if pos == 0:
+                bp = close
+                pos = 1
+        elif c_min < c_max:
+            if pos == 1:
+                pos = 0
+                sp = close
+                pc = (sp / bp - 1) * 100
+                percent_change.append(pc)
+
+        if num >= len(df) and pos == 1:
+            pos = 0
+            sp = close
+            pc = (sp / bp - 1) * 100
+            percent_change.append(pc)
+
+        num += 1
+    total_return = 1
+    for i in percent_change:
+        total_return = total_return * ((i / 100) + 1)
+
+    return round((total_return - 1) * 100, 2)
+
+
+def ema_strategy_vectorized(df):
+    close = df["Adj Close"].values
+    return simulator.total_return(simulator.trade_returns(close, simulator.ema_signal(close)))
+
+
+def synthetic_histories(symbols, bars, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2015-01-01", periods=bars, name="Date")
+
+    return [pd.DataFrame({"Adj Close": 100 * np.cumprod(1 + rng.normal(0.0005, 0.02, bars))}, index=index)
+            for _ in range(symbols)]
+
+
+def time_per_call(func, histories):
+    start = perf_counter()
+    results = [func(df) for df in histories]
+    return (perf_counter() - start) / len(histories), results
+
+
+def bench_ema_strategy(symbols, bars):
+    histories = synthetic_histories(symbols, bars)
+
+    loop_time, expected = time_per_call(ema_strategy_loop, histories)
+    vector_time, results = time_per_call(ema_strategy_vectorized, histories)
+
+    print(f"simulate_ema_strategy, {symbols} histories of {bars} bars:")
+    print(f"  loop        {loop_time * 1000:10.2f} ms per symbol")
+    print(f"  vectorized  {vector_time * 1000:10.2f} ms per symbol  ({loop_time / vector_time:.0f}x)")
+    print(f"  results match: {results == expected}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized code paths.")
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--bars", type=int, default=1500)
+    args = parser.parse_args()
+
+    bench_ema_strategy(args.symbols, args.bars)
+
+
+if __name__ == "__main__":
+    main()
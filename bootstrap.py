@@ -0,0 +1,57 @@
+import zlib
+
+import numpy as np
+
+# Bootstrap of a strategy's trade returns: each path redraws as many trades as were made, with replacement, and
+# compounds them. The spread of the paths' total returns and drawdowns shows how much of a simulated result could
+# be luck. Paths for many symbols are drawn and compounded together as one padded array.
+
+
+def resample(trade_lists, paths=1000, seed=None):
+    """Total % return and max % drawdown of `paths` resampled equity paths per trade list.
+
+    Returns two (len(trade_lists), paths) arrays; rows of lists without trades are 0.
+    """
+    rng = np.random.default_rng(seed)
+    counts = np.array([len(trades) for trades in trade_lists])
+    width = max(counts.max(initial=0), 1)
+
+    padded = np.zeros((len(trade_lists), width))
+    for i, trades in enumerate(trade_lists):
+        padded[i, :len(trades)] = trades
+
+    # Draw indices below each list's own length; draws past it are padding and leave the equity unchanged
+    draws = np.floor(rng.random((len(trade_lists), paths, width)) * np.maximum(counts, 1)[:, None, None]).astype(int)
+    growth = padded[np.arange(len(trade_lists))[:, None, None], draws] / 100 + 1
+    growth = np.where(np.arange(width) < counts[:, None, None], growth, 1.0)
+
+    equity = np.cumprod(growth, axis=2)
+    peaks = np.maximum.accumulate(np.maximum(equity, 1.0), axis=2)
+
+    return (equity[:, :, -1] - 1) * 100, np.min(equity / peaks - 1, axis=2) * 100
+
+
+def confidence_intervals(trade_lists, paths=1000, confidence=0.9, seed=None):
+    """Per trade list: the confidence interval of the total return and the max drawdown, and the share of paths
+    that made money."""
+    returns, drawdowns = resample(trade_lists, paths, seed)
+    tails = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+
+    return_low, return_high = np.percentile(returns, tails, axis=1)
+    drawdown_low, drawdown_high = np.percentile(drawdowns, tails, axis=1)
+
+    out = []
+    for i, trades in enumerate(trade_lists):
+        if len(trades) == 0:
+            out.append(dict.fromkeys(["return low", "return high", "drawdown low", "drawdown high", "p positive"],
+                                     np.nan))
+        else:
+            out.append({"return low": return_low[i], "return high": return_high[i], "drawdown low": drawdown_low[i],
+                        "drawdown high": drawdown_high[i], "p positive": np.mean(returns[i] > 0)})
+
+    return out
+
+
+def symbol_seed(symbol):
+    """A fixed seed per symbol, so repeated screens show the same intervals."""
+    return zlib.crc32(symbol.lower().strip().encode())
@@ -0,0 +1,124 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+
+                wait = (tokens - self.tokens) / self.rate
+
+            self.sleep(wait)
+
+
+def rate_limited(fetch, bucket):
+    if bucket is None:
+        return fetch
+
+    def limited_fetch(*args, **kwargs):
+        bucket.acquire()
+        return fetch(*args, **kwargs)
+
+    return limited_fetch
+
+
+class RefreshReport:
+
+    def __init__(self, total):
+        self.total = total
+        self.succeeded = []
+        self.failed = {}
+        self.attempts = 0
+        self.start = time.monotonic()
+        self.end = None
+
+    @property
+    def done(self):
+        return len(self.succeeded) + len(self.failed)
+
+    @property
+    def elapsed(self):
+        return (self.end or time.monotonic()) - self.start
+
+    @property
+    def throughput(self):
+        return self.done / self.elapsed if self.elapsed > 0 else float("inf")
+
+    def progress(self):
+        return f"Refreshed {self.done}/{self.total} symbols ({len(self.failed)} failed) - " \
+               f"{self.throughput:.2f} symbols/s"
+
+    def summary(self):
+        lines = [f"Refreshed {len(self.succeeded)}/{self.total} symbols in {self.elapsed:.2f} seconds "
+                 f"({self.throughput:.2f} symbols/s, {self.attempts} attempts)."]
+
+        for symbol, error in self.failed.items():
+            lines.append(f"Failed {symbol}: {error!r}")
+
+        return "\n".join(lines)
+
+
+def run_bulk(symbols, task, workers=8, retries=3, backoff=1.0, progress_every=25, sleep=time.sleep):
+    """Run task(symbol) for every symbol on a thread pool, retrying failures with exponential backoff.
+
+    Exceptions raised by the last attempt are collected in the returned report instead of being raised.
+    """
+    report = RefreshReport(len(symbols))
+    attempts_lock = threading.Lock()
+
+    def attempt(symbol):
+        error = None
+
+        for i in range(retries + 1):
+            with attempts_lock:
+                report.attempts += 1
+            try:
+                task(symbol)
+                return None
+            except Exception as e:
+                error = e
+
+                if i < retries:
+                    sleep(backoff * 2 ** i * random.uniform(1, 1.25))
+
+        return error
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(attempt, symbol): symbol for symbol in symbols}
+
+        for future in as_completed(futures):
+            symbol = futures[future]
+            error = future.result()
+
+            if error is None:
+                report.succeeded.append(symbol)
+            else:
+                report.failed[symbol] = error
+
+            if progress_every and report.done % progress_every == 0 and report.done < report.total:
+                print(report.progress())
+
+    report.end = time.monotonic()
+
+    return report
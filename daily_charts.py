@@ -13,7 +13,6 @@ import finance_logger
 import generate_html
 import ohlc
 
-os.chdir(sys.path[0])
 now = dt.datetime.now()
 datetime_file_format = '%Y_%m_%d_%H_%M_%S'
 date_hour_file_format = "%Y_%m_%d_%H"
@@ -68,6 +67,8 @@ def generate_daily_charts(debug=False):
 
     generate_html.generate_screener_html(debug=debug)
 
+    print(data_loader.history_cache.summary())
+
 
 def main(debug=False):
     script_name = os.path.basename(__file__)
@@ -84,4 +85,5 @@ def main(debug=False):
 
 
 if __name__ == "__main__":
+    os.chdir(sys.path[0])
     main(debug=False)
@@ -1,15 +1,25 @@
 import datetime as dt
 import json
 import os
+import time
 from datetime import datetime
 
-import bs4
+import numpy as np
 import pandas as pd
-import requests
-import yfinance as yf
-from pandas_datareader import data as pdr
 
-yf.pdr_override()
+import bulk_refresh
+import info_store
+import price_cache
+import price_store
+import providers
+import trading_calendar
+
+provider = providers.default_provider()
+
+history_cache = price_cache.PriceHistoryCache()
+
+# Where a history is downloaded from when the caller gives no start date
+default_start_date = dt.datetime(2000, 1, 1)
 
 info_types = ["info", "options", "dividends",
               "mutualfund_holders", "institutional_holders",
@@ -20,20 +30,65 @@ def date_parse(d):
     return datetime.strptime(d, "%Y-%m-%d")
 
 
-def load_price_history(symbol, start_date=dt.datetime(2000, 1, 1), end_date=dt.datetime.now(), market="us",
-                       reload=True):
+def set_provider(new_provider):
+    global provider
+    provider = new_provider
+
+
+def read_price_history(symbol, market="us"):
+    key = (market, price_store.symbol_filename(symbol))
+    stamp = price_store.source_stamp(symbol, market)
+    df = history_cache.get(key, stamp, price_store.last_bar(symbol, market))
+
+    if df is None:
+        df = price_store.read_price_history(symbol, market)
+
+        if df is not None:
+            history_cache.put(key, price_store.source_stamp(symbol, market), price_store.last_bar(symbol, market), df)
+
+    return df
+
+
+def save_price_history(df, symbol, market="us"):
+    records = price_store.write_price_history(df, symbol, market)
+
+    key = (market, price_store.symbol_filename(symbol))
+    history_cache.put(key, price_store.source_stamp(symbol, market), price_store.last_bar(symbol, market),
+                      price_store.from_records(records))
+
+
+def append_price_history(df_new, symbol, market="us"):
+    """Upsert df_new into the saved history and return the history as saved, which is also what gets cached."""
+    price_store.append_price_history(df_new, symbol, market)
+
+    df = price_store.read_price_history(symbol, market)
+
+    key = (market, price_store.symbol_filename(symbol))
+    history_cache.put(key, price_store.source_stamp(symbol, market), price_store.last_bar(symbol, market), df)
+
+    return df
+
+
+def load_price_history(symbol, start_date=None, end_date=dt.datetime.now(), market="us", reload=True, fetch=None):
+    """Price history of a symbol, refreshed from the provider with reload. A saved history is only extended backwards
+    when start_date is given: without one it is taken to begin at the symbol's first available bar."""
     now = dt.datetime.now()
     symbol = symbol.lower().strip()
-    symbol_filename = "-".join(symbol.split("."))
 
-    file_path = f"data/{market}/price_history/{symbol_filename}.csv"
+    extend_back = start_date is not None
+    if start_date is None:
+        start_date = default_start_date
+
+    if fetch is None:
+        fetch = provider.history
+
     if reload:
-        if os.path.isfile(file_path):  # download only data from one day after latest date in csv
-            df_old = pd.read_csv(file_path, index_col=0, parse_dates=True)
+        if price_store.has_price_history(symbol, market):  # download only data from one day after latest date saved
+            df_old = read_price_history(symbol, market)
 
             if len(df_old) == 0:
-                df = pdr.get_data_yahoo(symbol, start_date, end_date)
-                df.reset_index(level=0).to_csv(file_path, index=False, date_format="%Y-%m-%d")
+                df = fetch(symbol, start_date, end_date)
+                save_price_history(df, symbol, market)
 
                 return df
 
@@ -41,53 +96,88 @@ def load_price_history(symbol, start_date=dt.datetime(2000, 1, 1), end_date=dt.d
             lastest_saved_date = df_old.index[-1]
 
             try:
-                if start_date < oldest_saved_date:
-                    df_older = pdr.get_data_yahoo(symbol, start_date, oldest_saved_date - dt.timedelta(days=1))
+                extend_back = extend_back and start_date < oldest_saved_date
+
+                # already complete up to the last closed session, so there is nothing to download
+                if not extend_back and trading_calendar.is_up_to_date(
+                        lastest_saved_date, market, written=price_store.written_at(symbol, market)):
+                    return df_old[(df_old.index >= start_date) & (df_old.index <= end_date)]
+
+                ranges = [(symbol, lastest_saved_date, now)]
+                if extend_back:
+                    ranges.insert(0, (symbol, start_date, oldest_saved_date - dt.timedelta(days=1)))
+
+                # adjacent ranges are merged into a single request
+                fetched = providers.fetch_many(fetch, ranges)
+
+                prepended = False
+                if extend_back:
+                    df_older = fetched[0]
                     df_older = df_older[(df_older.index >= start_date) & (df_older.index < oldest_saved_date)]
                     df_old = pd.concat([df_older, df_old])
+                    prepended = len(df_older) > 0
 
-                df_old = df_old[df_old.index < lastest_saved_date]
-                df_new = pdr.get_data_yahoo(symbol, lastest_saved_date, now)
+                df_new = fetched[-1]
                 df_new = df_new[df_new.index >= lastest_saved_date]
                 df_new = df_new[~df_new.index.duplicated(keep="first")]
-                df = pd.concat([df_old, df_new])
 
-                df.reset_index(level=0).to_csv(file_path, index=False, date_format="%Y-%m-%d")
+                # The new rows replace the saved ones from their first date on, like the store's upsert, so a saved
+                # last bar the reply leaves out is kept
+                if len(df_new) > 0:
+                    df = pd.concat([df_old[df_old.index < df_new.index[0]], df_new])
+                else:  # nothing newer was returned, keep the saved last bar
+                    df = df_old
+
+                if prepended:
+                    save_price_history(df, symbol, market)
+                elif len(df_new) > 0:
+                    df = append_price_history(df_new, symbol, market)
 
                 return df[(df.index >= start_date) & (df.index <= end_date)]
             except TypeError:
-                df = pdr.get_data_yahoo(symbol, start_date, end_date)
-                df.reset_index(level=0).to_csv(file_path, index=False, date_format="%Y-%m-%d")
+                df = fetch(symbol, start_date, end_date)
+                save_price_history(df, symbol, market)
 
                 return df
 
-        else:  # no csv exits
-            df = pdr.get_data_yahoo(symbol, start_date, end_date)
+        else:  # nothing saved yet
+            df = fetch(symbol, start_date, end_date)
 
-            directory = f"data/{market}/price_history"
-            if not os.path.exists(directory):
-                os.makedirs(directory)
-
-            print(file_path)
-            df.reset_index(level=0).to_csv(file_path, index=False, date_format="%Y-%m-%d")
+            print(price_store.store_path(symbol, market))
+            save_price_history(df, symbol, market)
 
             return df
     else:  # don't reload
-        df = pd.read_csv(file_path, index_col=0, parse_dates=True)
+        df = read_price_history(symbol, market)
+
+        if df is None:
+            raise FileNotFoundError(f"No price history saved for {symbol} ({market}).")
+
         try:
-            return df[
-                (pd.to_datetime(df.index).floor('D') >= start_date) & (pd.to_datetime(df.index).floor('D') <= end_date)]
+            return df[(df.index.floor('D') >= start_date) & (df.index.floor('D') <= end_date)]
         except TypeError:
-            df = pdr.get_data_yahoo(symbol, start_date, end_date)
-            df.reset_index(level=0).to_csv(file_path, index=False, date_format="%Y-%m-%d")
+            df = fetch(symbol, start_date, end_date)
+            save_price_history(df, symbol, market)
             return df
 
 
-def reload_all(symbols, start_date=dt.datetime(2000, 1, 1), end_date=dt.datetime.now()):
+def reload_all(symbols, start_date=None, end_date=dt.datetime.now(), market="us", workers=8,
+               rate=4.0, retries=3, backoff=1.0, fetch=None):
     symbols = remove_duplicates(symbols)
-    for symbol in symbols:
-        df = load_price_history(symbol, start_date, end_date)
-        print(df.index[0], df.index[-1])
+
+    if fetch is None:
+        fetch = provider.history
+
+    bucket = bulk_refresh.TokenBucket(rate) if rate else None
+    fetch = bulk_refresh.rate_limited(fetch, bucket)
+
+    def refresh(symbol):
+        load_price_history(symbol, start_date, end_date, market=market, fetch=fetch)
+
+    report = bulk_refresh.run_bulk(symbols, refresh, workers=workers, retries=retries, backoff=backoff)
+    print(report.summary())
+
+    return report
 
 
 def reload_sandp500():
@@ -98,72 +188,75 @@ def reload_sandp500():
 
 def load_ticker_info(symbol, market="us", type_str="info", reload=False):
     symbol = symbol.lower().strip()
+    return load_ticker_info_many([symbol], market=market, type_str=type_str, reload=reload).get(symbol)
 
-    if type_str in ["info", "isin", "options"]:
-        extn = "json"
-    else:
-        extn = "csv"
 
-    symbol_filename = "-".join(symbol.split("."))
+def load_ticker_info_many(symbols, market="us", type_str="info", reload=False, workers=8):
+    """Answer info lookups from the info store, downloading only missing entries (and expired ones if reload)."""
+    if type_str not in info_types:
+        print(f"Error - info type \"{type_str}\" is not a valid option.")
+        return {}
 
-    file_path = f"data/{market}/info/{type_str}/{symbol_filename}.{extn}"
+    symbols = remove_duplicates([symbol.lower().strip() for symbol in symbols])
+    stored = info_store.get_many(symbols, type_str, market)
 
-    if reload or not os.path.isfile(file_path):
-        print(f"Downloading {type_str} for {symbol}..")
+    legacy = {symbol: _load_legacy_ticker_info(symbol, market, type_str) for symbol in symbols if symbol not in stored}
+    legacy = {symbol: value for symbol, value in legacy.items() if value is not None}
+    if legacy:
+        fetched_at = {symbol: value[0] for symbol, value in legacy.items()}
+        info_store.put_many({symbol: value[1] for symbol, value in legacy.items()}, type_str, market, fetched_at)
+        stored.update(legacy)
 
-        ticker = yf.Ticker(symbol)
+    now = time.time()
+    stale = [symbol for symbol in symbols
+             if symbol not in stored or (reload and info_store.is_stale(stored[symbol][0], type_str, now))]
 
-        if type_str in ["info", "options"]:
-            extn = "json"
-            file_path = f"data/{market}/info/{type_str}/{symbol}.{extn}"
-            if type_str == "info":
-                try:
-                    info_dict = ticker.info
-                except:
-                    print(f"Error, no info found for {symbol}.")
-                    return
-            else:
-                info_dict = ticker.options
+    if stale:
+        print(f"Downloading {type_str} for {len(stale)} symbols..")
 
-            with open(file_path, "w") as f:
-                json.dump(info_dict, f, indent=4)
+        fetched = {}
 
-            return info_dict
-        else:
-            extn = "csv"
-            file_path = f"data/{market}/info/{type_str}/{symbol}.{extn}"
-
-            if type_str == "actions":
-                info_df = ticker.actions
-            elif type_str == "calendar":
-                info_df = ticker.calendar
-            elif type_str == "dividends":
-                info_df = ticker.dividends
-            elif type_str == "institutional_holders":
-                info_df = ticker.institutional_holders
-            elif type_str == "major_holders":
-                info_df = ticker.major_holders
-            elif type_str == "mutualfund_holders":
-                info_df = ticker.mutualfund_holders
-            elif type_str == "splits":
-                info_df = ticker.splits
-            else:
-                print(f"Error - info type \"{type_str}\" is not a valid option.")
-                return
+        def download(symbol):
+            fetched[symbol] = provider.info(symbol, type_str)
 
-            info_df.to_csv(file_path)
-            return info_df
+        report = bulk_refresh.run_bulk(stale, download, workers=workers, retries=1, progress_every=0)
+
+        for symbol in report.failed:
+            print(f"Error, no {type_str} found for {symbol}.")
+
+        info_store.put_many(fetched, type_str, market, now)
+        stored.update({symbol: (now, value) for symbol, value in fetched.items()})
+
+    return {symbol: stored[symbol][1] for symbol in symbols if symbol in stored}
 
-    else:
-        if extn == "json":
-            with open(file_path, "r") as f:
-                return json.load(f)
-        elif extn == "csv":
-            return pd.read_csv(file_path)
+
+def refresh_ticker_info(symbols, market="us", type_strs=("info",), workers=8):
+    for type_str in type_strs:
+        load_ticker_info_many(symbols, market=market, type_str=type_str, reload=True, workers=workers)
+
+
+def _load_legacy_ticker_info(symbol, market, type_str):
+    # Per-symbol files written before the info store existed, imported with their modification time
+    extn = "json" if type_str in ["info", "options"] else "csv"
+
+    for filename in [price_store.symbol_filename(symbol), symbol]:
+        file_path = f"data/{market}/info/{type_str}/{filename}.{extn}"
+
+        if os.path.isfile(file_path):
+            if extn == "json":
+                with open(file_path, "r") as f:
+                    return os.path.getmtime(file_path), json.load(f)
+            else:
+                return os.path.getmtime(file_path), pd.read_csv(file_path)
+
+    return None
 
 
 def load_sandp500_symbols(reload=False):
     if reload:
+        import bs4
+        import requests
+
         symbols = []
         with requests.get("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies") as resp:
             soup = bs4.BeautifulSoup(resp.content, "lxml")
@@ -190,33 +283,93 @@ def remove_duplicates(seq):
     return [x for x in seq if not (x in seen or seen_add(x))]
 
 
-def all_prices_df(market="us", reload=True):
+def all_prices_df(market="us", reload=True, symbols=None, incremental=True):
     if reload:
-        symbols = load_sandp500_symbols()
+        if symbols is None:
+            symbols = load_sandp500_symbols()
+        symbols = remove_duplicates(symbols)
 
-        all_df = pd.DataFrame()
+        panel = price_store.read_panel(market) if incremental else None
+        old_stamps = panel[3] if panel is not None else {}
 
+        changed = {}
+        stamps = {}
         for symbol in symbols:
-            df = load_price_history(symbol, reload=False)[["Adj Close"]].rename({"Adj Close": symbol}, axis=1)
-            all_df = all_df.join(df, how="outer")
+            if not price_store.has_price_history(symbol, market):
+                print(f"No price history saved for {symbol}, skipping.")
+                continue
 
-        all_df.reset_index(level=0).to_csv(f"data/{market}/price_history/all/all.csv", index=False,
-                                           date_format="%Y-%m-%d")
+            stamp = price_store.source_stamp(symbol, market)
+            if stamp is None or stamp != old_stamps.get(symbol):
+                changed[symbol] = load_price_history(symbol, market=market, reload=False)["Adj Close"]
+                stamp = price_store.source_stamp(symbol, market)
+            stamps[symbol] = stamp
+
+        symbols = [symbol for symbol in symbols if symbol in stamps]
+
+        if panel is not None and not changed and symbols == panel[1]:
+            return all_prices_df(market, reload=False)
+
+        if panel is None:
+            all_df = pd.concat(changed, axis=1, join="outer", sort=True) if changed else pd.DataFrame()
+            all_df = all_df.reindex(columns=symbols)
+        else:
+            all_df = _update_panel(panel, symbols, changed)
+
+        all_df.index.name = "Date"
+        price_store.write_panel(all_df.index.values, symbols, all_df.values, stamps, market)
 
         return all_df
 
     else:
-        return pd.read_csv(f"data/{market}/price_history/all/all.csv", index_col=0, parse_dates=True)
+        panel = price_store.read_panel(market)
+
+        if panel is None:
+            return pd.read_csv(f"data/{market}/price_history/all/all.csv", index_col=0, parse_dates=True)
+
+        dates, symbols, values, stamps = panel
+        return pd.DataFrame(np.array(values), columns=symbols,
+                            index=pd.DatetimeIndex(dates.astype("datetime64[ns]"), name="Date"))
+
+
+def _update_panel(panel, symbols, changed):
+    dates, old_symbols, values, stamps = panel
+    old_index = pd.DatetimeIndex(dates.astype("datetime64[ns]"))
+
+    index = old_index
+    for series in changed.values():
+        if not series.index.isin(index).all():
+            index = index.union(series.index)
+
+    new_values = np.full((len(index), len(symbols)), np.nan)
+
+    # Unchanged symbols keep their stored column; new dates are only ever added as rows.
+    old_positions = {symbol: i for i, symbol in enumerate(old_symbols)}
+    kept = [(j, old_positions[symbol]) for j, symbol in enumerate(symbols)
+            if symbol not in changed and symbol in old_positions]
+    if kept:
+        new_cols, old_cols = map(list, zip(*kept))
+        rows = np.arange(len(old_index)) if index.equals(old_index) else index.get_indexer(old_index)
+        new_values[rows[:, None], new_cols] = np.asarray(values)[:, old_cols]
+
+    positions = {symbol: j for j, symbol in enumerate(symbols)}
+    for symbol, series in changed.items():
+        new_values[index.get_indexer(series.index), positions[symbol]] = series.values
+
+    return pd.DataFrame(new_values, columns=symbols, index=index)
+
+
+def resample_bars(df, rule):
+    return df.resample(rule, label="left").agg({"Open": "first", "High": "max", "Low": "min",
+                                                "Close": "last", "Adj Close": "last", "Volume": "sum"})
 
 
 def weekly(df):
-    return df.resample("W", label="left").agg({"Open": "first", "High": "max", "Low": "min",
-                                               "Close": "last", "Adj Close": "last", "Volume": "sum"})
+    return resample_bars(df, "W")
 
 
 def monthly(df):
-    return df.resample("M", label="left").agg({"Open": "first", "High": "max", "Low": "min",
-                                               "Close": "last", "Adj Close": "last", "Volume": "sum"})
+    return resample_bars(df, "M")
 
 
 def watchlist():
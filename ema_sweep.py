@@ -0,0 +1,143 @@
+import itertools
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+import simulator
+
+# Parameter sweeps of simulator's moving-average strategy: every (fast set, slow set, start date) combination over
+# every symbol. Each symbol's rolling means are computed once per window for all the combinations, and with
+# workers > 1 the symbols are split over a process pool that reads the price panel from shared memory.
+
+result_columns = ["fast", "slow", "start", "symbol", "total return", "trades", "win rate", "max drawdown"]
+
+# Set in each pool worker by _attach
+_shared = {}
+
+
+def combinations(fast_sets=(simulator.smas_min,), slow_sets=(simulator.smas_max,), starts=(simulator.start,)):
+    return [(tuple(fast), tuple(slow), pd.Timestamp(start))
+            for fast, slow, start in itertools.product(fast_sets, slow_sets, starts)]
+
+
+def max_drawdown(percent_changes):
+    """Largest fall (in percent) of the equity compounded trade by trade from its running peak."""
+    if len(percent_changes) == 0:
+        return 0.0
+
+    equity = np.cumprod(np.asarray(percent_changes) / 100 + 1)
+    peaks = np.maximum.accumulate(np.concatenate([[1.0], equity]))[1:]
+
+    return round(float(np.min(equity / peaks - 1)) * 100, 2)
+
+
+def sweep_symbol(dates, close, combos):
+    """Result rows (without the symbol) of every combination for one price history."""
+    valid = ~np.isnan(close)
+    dates, close = dates[valid], close[valid]
+
+    series = pd.Series(close)
+    windows = sorted({window for fast, slow, _ in combos for window in fast + slow})
+    means = {window: np.round(series.rolling(window=window).mean(), 2).values for window in windows}
+
+    rows = []
+    for fast, slow, start in combos:
+        first = np.searchsorted(dates, np.datetime64(start))
+
+        def averages(windows):
+            # A history starting at `first` has no mean for a window until it holds that many bars
+            out = np.column_stack([means[window][first:] for window in windows])
+            for i, window in enumerate(windows):
+                out[:window - 1, i] = np.nan
+            return out
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows
+            signal = np.nanmin(averages(fast), axis=1) - np.nanmax(averages(slow), axis=1)
+
+        changes = simulator.trade_returns(close[first:], signal)
+
+        rows.append([",".join(map(str, fast)), ",".join(map(str, slow)), start.strftime("%Y-%m-%d"),
+                     simulator.total_return(changes) if len(close) > first else np.nan, len(changes),
+                     np.mean(changes > 0) if len(changes) else np.nan, max_drawdown(changes)])
+
+    return rows
+
+
+def _attach(name, shape, dates):
+    memory = shared_memory.SharedMemory(name=name)
+    _shared.update(memory=memory, prices=np.ndarray(shape, dtype="f8", buffer=memory.buf), dates=dates)
+
+
+def _sweep_columns(columns, symbols, combos, prices=None, dates=None):
+    prices = _shared["prices"] if prices is None else prices
+    dates = _shared["dates"] if dates is None else dates
+
+    rows = []
+    for column, symbol in zip(columns, symbols):
+        for row in sweep_symbol(dates, prices[:, column], combos):
+            rows.append(row[:3] + [symbol] + row[3:])
+
+    return rows
+
+
+def sweep(panel, combos, workers=1, chunks_per_worker=4):
+    """Results table of every combination for every symbol of a dates x symbols price panel."""
+    dates = panel.index.values.astype("datetime64[ns]")
+    prices = np.ascontiguousarray(panel.values, dtype="f8")
+    symbols = list(panel.columns)
+
+    if workers is None or workers <= 1 or len(symbols) <= 1:
+        return pd.DataFrame(_sweep_columns(range(len(symbols)), symbols, combos, prices, dates),
+                            columns=result_columns)
+
+    chunk_size = max(1, -(-len(symbols) // (workers * chunks_per_worker)))
+    chunks = [list(range(i, min(i + chunk_size, len(symbols)))) for i in range(0, len(symbols), chunk_size)]
+
+    memory = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+    try:
+        np.ndarray(prices.shape, dtype="f8", buffer=memory.buf)[:] = prices
+
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=(memory.name, prices.shape, dates)) as executor:
+            for chunk_rows in executor.map(_sweep_columns, chunks, [[symbols[i] for i in chunk] for chunk in chunks],
+                                           itertools.repeat(combos)):
+                rows.extend(chunk_rows)
+    finally:
+        memory.close()
+        memory.unlink()
+
+    return pd.DataFrame(rows, columns=result_columns)
+
+
+def summary(results):
+    """One row per combination: mean total return and drawdown over the symbols, trades and the overall win rate."""
+    results = results.assign(wins=results["win rate"].fillna(0) * results["trades"])
+    grouped = results.groupby(["fast", "slow", "start"], sort=False)
+
+    out = grouped.agg(symbols=("symbol", "count"), total_return=("total return", "mean"), trades=("trades", "sum"),
+                      wins=("wins", "sum"), max_drawdown=("max drawdown", "mean"))
+    out["win rate"] = np.round(out.pop("wins") / out["trades"].replace(0, np.nan), 4)
+
+    return out.rename(columns={"total_return": "mean total return", "max_drawdown": "mean max drawdown"})
+
+
+def load_panel(symbols, market="us"):
+    """Adjusted closes of the symbols with a saved history, one column each."""
+    closes = {}
+    for symbol in symbols:
+        try:
+            closes[symbol] = data_loader.load_price_history(symbol, market=market, reload=False)["Adj Close"]
+        except FileNotFoundError:
+            print(f"No price history saved for {symbol}, skipping.")
+
+    return pd.concat(closes, axis=1, join="outer", sort=True) if closes else pd.DataFrame()
+
+
+def sweep_symbols(symbols, combos, market="us", workers=1):
+    return sweep(load_panel(symbols, market), combos, workers=workers)
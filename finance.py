@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+import argparse
+import importlib
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from time import time
+
+# Single entry point for the cron jobs. Nothing heavy is imported here: each subcommand imports the modules it needs
+# when it runs, so e.g. a price refresh never pays for matplotlib, praw or nltk.
+
+
+def run_script(module_name, debug):
+    importlib.import_module(module_name).main(debug=debug)
+
+
+def cmd_sentiment_words(args):
+    run_script("sentiment_words", args.debug)
+
+
+def cmd_sentiment_charts(args):
+    run_script("sentiment_charts", args.debug)
+
+
+def cmd_daily_charts(args):
+    run_script("daily_charts", args.debug)
+
+
+def cmd_html(args):
+    run_script("generate_html", args.debug)
+
+
+def cmd_refresh(args):
+    import data_loader
+
+    symbols = args.symbols or data_loader.load_sandp500_symbols(reload=args.reload_symbols)
+    data_loader.reload_all(symbols, market=args.market, workers=args.workers)
+
+
+def cmd_screen(args):
+    import stock_screener
+
+    if args.out:
+        stock_screener.screen_stocks(args.symbols, reload=args.reload, remove_screened=not args.all, sink=args.out,
+                                     collect=False, workers=args.workers)
+        print(f"Wrote the screened rows to {args.out}.")
+        return
+
+    df = stock_screener.screen_stocks(args.symbols, reload=args.reload, remove_screened=not args.all,
+                                      workers=args.workers)
+    print(df.to_string() if df is not None else "No stocks passed the screen.")
+
+
+def cmd_scan(args):
+    import screen_rules
+    import vector_screener
+
+    if args.rule:
+        screen = screen_rules.Screen({f"rule_{i + 1}": rule for i, rule in enumerate(args.rule)})
+    elif args.screen:
+        screen = screen_rules.load_screen(args.screen)
+    else:
+        screen = screen_rules.minervini
+
+    if args.history:
+        horizons = [int(horizon) for horizon in args.history.split(",")]
+        passed, forward = vector_screener.screen_history(market=args.market, horizons=horizons, reload=args.reload,
+                                                         screen=screen)
+        print(f"{int(passed.values.sum())} passes over {len(passed)} dates and {len(passed.columns)} symbols.")
+        print(vector_screener.hit_rates(passed.values, {h: df.values for h, df in forward.items()}).to_string())
+        return
+
+    out = vector_screener.screen_universe(market=args.market, reload=args.reload, screen=screen)
+    passed = out.index[out["pass"]]
+    print(f"{len(passed)} of {len(out)} symbols passed: {', '.join(passed)}")
+
+
+def cmd_sweep(args):
+    import ema_sweep
+
+    def windows(sets):
+        return [[int(window) for window in windows.split(",")] for windows in sets] if sets else None
+
+    combos = ema_sweep.combinations(windows(args.fast) or (ema_sweep.simulator.smas_min,),
+                                    windows(args.slow) or (ema_sweep.simulator.smas_max,),
+                                    args.start or (ema_sweep.simulator.start,))
+    results = ema_sweep.sweep_symbols(args.symbols, combos, market=args.market, workers=args.workers)
+    print(ema_sweep.summary(results).to_string())
+
+    if args.out:
+        results.to_csv(args.out, index=False)
+
+
+def cmd_backtest(args):
+    import backtest
+    import data_loader
+    import relative_strength
+    import vector_screener
+
+    panel = data_loader.all_prices_df(market=args.market, reload=args.reload)
+
+    if args.signal == "screen":
+        signals, _ = vector_screener.historical_screen(panel.values, horizons=())
+    else:
+        signals = backtest.ema_signals(panel.values)
+
+    scores = relative_strength.rs_ratings(panel.values) if args.max_positions else None
+    result = backtest.backtest(panel, signals, rebalance=args.rebalance, sizing=args.sizing,
+                               max_positions=args.max_positions, scores=scores, cost=args.cost / 10000)
+
+    for name, value in backtest.statistics(result).items():
+        print(f"{name:>16}: {value:10.2f}")
+
+
+def cmd_dots(args):
+    import data_loader
+    import signals
+
+    symbols = args.symbols or data_loader.load_sandp500_symbols()
+    out = signals.scan(symbols, market=args.market)
+
+    for name in ["green_dot", "blue_dot"]:
+        print(f"{name.replace('_', ' ')}s today: {', '.join(out.index[out[name]]) or '-'}")
+
+
+def cmd_pivots(args):
+    import data_loader
+    import pivot_points
+
+    symbols = args.symbols or data_loader.load_sandp500_symbols()
+    out = pivot_points.scan(symbols, market=args.market, window=args.window, confirmation=args.confirmation)
+
+    # The latest pivot of each symbol
+    for symbol, row in out.groupby("Symbol").last().iterrows():
+        print(f"{symbol:>8} {row['Pivot']:10.2f} {row['Date']:%Y-%m-%d} (confirmed {row['Confirmed']:%Y-%m-%d})")
+
+
+def cmd_migrate(args):
+    import price_store
+
+    for market in args.markets:
+        print(f"Migrated {len(price_store.migrate_csv_store(market, remove_csv=args.remove_csv))} {market} "
+              f"price histories.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="finance", description="Stock price loader, screener and charts.")
+    parser.add_argument("--importtime", action="store_true",
+                        help="run the command under python -X importtime and print a per-package breakdown")
+    parser.add_argument("--importtime-top", type=int, default=15, help="packages shown in the breakdown")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name, func, help_str in [("sentiment-words", cmd_sentiment_words, "download and score reddit headlines"),
+                                 ("sentiment-charts", cmd_sentiment_charts, "plot the sentiment charts"),
+                                 ("daily-charts", cmd_daily_charts, "plot the daily ohlc charts and screener page"),
+                                 ("html", cmd_html, "regenerate every html page")]:
+        sub = subparsers.add_parser(name, help=help_str)
+        sub.add_argument("--debug", action="store_true")
+        sub.set_defaults(func=func)
+
+    sub = subparsers.add_parser("refresh", help="refresh price histories (default: the S&P 500)")
+    sub.add_argument("symbols", nargs="*")
+    sub.add_argument("--market", default="us")
+    sub.add_argument("--workers", type=int, default=8)
+    sub.add_argument("--reload-symbols", action="store_true", help="re-download the S&P 500 symbol list")
+    sub.set_defaults(func=cmd_refresh)
+
+    sub = subparsers.add_parser("screen", help="run the Minervini screen on symbols")
+    sub.add_argument("symbols", nargs="+")
+    sub.add_argument("--reload", action="store_true")
+    sub.add_argument("--all", action="store_true", help="keep the symbols that fail the screen")
+    sub.add_argument("--workers", type=int, default=1)
+    sub.add_argument("--out", help="stream the rows to a .csv or .parquet file instead of printing them")
+    sub.set_defaults(func=cmd_screen)
+
+    sub = subparsers.add_parser("scan", help="run a rule screen over the whole price panel (default: Minervini)")
+    sub.add_argument("--rule", action="append", help="e.g. \"close > sma(150) > sma(200) and rsi(14) > 70\"")
+    sub.add_argument("--screen", help="json file of {\"rules\": {...}, \"definitions\": {...}}")
+    sub.add_argument("--market", default="us")
+    sub.add_argument("--reload", action="store_true", help="rebuild the price panel first")
+    sub.add_argument("--history", metavar="HORIZONS",
+                     help="screen every date instead and report forward returns over e.g. 5,21,63 bars")
+    sub.set_defaults(func=cmd_scan)
+
+    sub = subparsers.add_parser("sweep", help="sweep the moving-average strategy's parameters over symbols")
+    sub.add_argument("symbols", nargs="+")
+    sub.add_argument("--fast", action="append", help="comma separated fast windows, repeat for more sets")
+    sub.add_argument("--slow", action="append", help="comma separated slow windows, repeat for more sets")
+    sub.add_argument("--start", action="append", help="start date (YYYY-MM-DD), repeat for more")
+    sub.add_argument("--market", default="us")
+    sub.add_argument("--workers", type=int, default=os.cpu_count())
+    sub.add_argument("--out", help="also write every (combination, symbol) row to this csv")
+    sub.set_defaults(func=cmd_sweep)
+
+    sub = subparsers.add_parser("backtest", help="backtest a portfolio of the screen or ema signals on the panel")
+    sub.add_argument("--signal", choices=["screen", "ema"], default="screen")
+    sub.add_argument("--rebalance", default="W", help="D, W, M, Q or Y")
+    sub.add_argument("--sizing", choices=["equal", "inverse_volatility"], default="equal")
+    sub.add_argument("--max-positions", type=int, help="hold at most this many, by RS rating")
+    sub.add_argument("--cost", type=float, default=10, help="trading cost in basis points of turnover")
+    sub.add_argument("--market", default="us")
+    sub.add_argument("--reload", action="store_true", help="rebuild the price panel first")
+    sub.set_defaults(func=cmd_backtest)
+
+    sub = subparsers.add_parser("dots", help="list the symbols with a green or blue chart dot on their last bar")
+    sub.add_argument("symbols", nargs="*", help="default: the S&P 500")
+    sub.add_argument("--market", default="us")
+    sub.set_defaults(func=cmd_dots)
+
+    sub = subparsers.add_parser("pivots", help="list each symbol's latest pivot high")
+    sub.add_argument("symbols", nargs="*", help="default: the S&P 500")
+    sub.add_argument("--window", type=int, default=9, help="bars the pivot must be the highest of")
+    sub.add_argument("--confirmation", type=int, default=5, help="bars in a row it must stay the highest")
+    sub.add_argument("--market", default="us")
+    sub.set_defaults(func=cmd_pivots)
+
+    sub = subparsers.add_parser("migrate", help="convert price_history csv files to the binary store")
+    sub.add_argument("markets", nargs="*", default=["us", "nz"])
+    sub.add_argument("--remove-csv", action="store_true")
+    sub.set_defaults(func=cmd_migrate)
+
+    return parser
+
+
+def import_time_breakdown(lines, top=15):
+    """Sum the self time of `-X importtime` lines per top-level package."""
+    self_us = defaultdict(int)
+    pattern = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\S.*)$")
+
+    for line in lines:
+        match = pattern.match(line)
+        if match:
+            self_us[match.group(3).strip().split(".")[0]] += int(match.group(1))
+
+    total = sum(self_us.values())
+    out = [f"Import time: {total / 1e6:.3f} seconds in {len(self_us)} top-level packages"]
+
+    for package, us in sorted(self_us.items(), key=lambda item: item[1], reverse=True)[:top]:
+        out.append(f"{us / 1e6:10.3f} s  {us / total * 100 if total else 0:5.1f}%  {package}")
+
+    return "\n".join(out)
+
+
+def run_with_importtime(argv, top):
+    command = [sys.executable, "-X", "importtime", os.path.abspath(__file__)] + argv
+    proc = subprocess.run(command, stderr=subprocess.PIPE, text=True)
+
+    import_lines = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:"):
+            import_lines.append(line)
+        else:
+            print(line, file=sys.stderr)
+
+    print(import_time_breakdown(import_lines, top))
+
+    return proc.returncode
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+
+    if args.importtime:
+        return run_with_importtime([arg for arg in argv if arg != "--importtime"], args.importtime_top)
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    start = time()
+    args.func(args)
+    print(f"finance {args.command} finished in {time() - start:.2f} seconds.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,8 +10,6 @@ import data_loader
 import finance_logger
 import stock_screener
 
-os.chdir(sys.path[0])
-
 
 def markdown_to_html(input_file):
     with open(input_file, "r") as f:
@@ -101,7 +99,7 @@ def generate_screener_html(debug=False):
     if debug:
         watchlist = watchlist[:2]
 
-    df = stock_screener.screen_stocks(watchlist, remove_screened=False, reload=True)
+    df = stock_screener.screen_stocks(watchlist, remove_screened=False, reload=True, workers=os.cpu_count())
 
     table = df.to_html(index=False, na_rep="")
 
@@ -127,7 +125,8 @@ def generate_screener_html(debug=False):
     if debug:
         reddit_top_symbols = reddit_top_symbols[:2]
 
-    df2 = stock_screener.screen_stocks(reddit_top_symbols, remove_screened=False, reload=True)
+    df2 = stock_screener.screen_stocks(reddit_top_symbols, remove_screened=False, reload=True,
+                                       workers=os.cpu_count())
 
     table = df2.to_html(index=False, na_rep="")
 
@@ -185,5 +184,6 @@ def main(debug=False):
 
 
 if __name__ == "__main__":
+    os.chdir(sys.path[0])
     # main(debug=False)
     generate_sentiment_html()
@@ -13,6 +13,7 @@ df = dl.load_price_history("aapl", start_date=dt.datetime(2018, 1, 1))
 
 df.drop(df[df["Volume"] < 1000].index, inplace=True)
 
+# Resampled here rather than read with bars.load_bars, whose stored bars keep the low-volume rows dropped above
 df_monthly = dl.monthly(df)
 
 # GLV: green line value
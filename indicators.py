@@ -0,0 +1,228 @@
+import math
+import os
+import pickle
+from collections import deque
+
+import numpy as np
+
+# Indicator state carried from one bar to the next, so a daily screen only feeds the bars that arrived since the
+# last run instead of recomputing every rolling window over the whole history.
+
+
+def indicator_directory(market="us"):
+    return f"data/{market}/indicators"
+
+
+def state_path(symbol, market="us"):
+    return f"{indicator_directory(market)}/{symbol.lower().strip()}.p"
+
+
+class RunningSum:
+    """Sum and count of the non-NaN values among the last `window` bars."""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.count = 0
+        self.updates = 0
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            old = self.values[0]
+            if not math.isnan(old):
+                self.total -= old
+                self.count -= 1
+
+        self.values.append(value)
+        if not math.isnan(value):
+            self.total += value
+            self.count += 1
+
+        # Re-add the window every `window` bars so the running total does not drift
+        self.updates += 1
+        if self.updates % self.window == 0:
+            self.total = math.fsum(value for value in self.values if not math.isnan(value))
+
+    def mean(self):
+        if self.count < self.window:
+            return np.nan
+        return self.total / self.count
+
+
+class RunningExtreme:
+    """Max (or min) of the last `window` bars, from a monotonic deque of (bar number, value)."""
+
+    def __init__(self, window, maximum=True):
+        self.window = window
+        self.sign = 1 if maximum else -1
+        self.candidates = deque()
+        self.bars = 0
+
+    def update(self, value):
+        if not math.isnan(value):
+            while self.candidates and self.sign * self.candidates[-1][1] <= self.sign * value:
+                self.candidates.pop()
+            self.candidates.append((self.bars, value))
+
+        self.bars += 1
+        while self.candidates and self.candidates[0][0] <= self.bars - 1 - self.window:
+            self.candidates.popleft()
+
+    def value(self):
+        return self.candidates[0][1] if self.candidates else np.nan
+
+
+class IndicatorState:
+    """SMAs, the 52-week high/low and RSI of the adjusted close, updated one bar at a time in O(1).
+
+    rsi() matches stock_screener.rsi (the time_period - 1 changes up to the previous bar); wilder_rsi() is the
+    usual Wilder-smoothed RSI.
+    """
+
+    def __init__(self, smas=(50, 150, 200), extreme_window=260, rsi_period=14, sma_lag=19):
+        self.smas = {window: RunningSum(window) for window in smas}
+        self.high = RunningExtreme(extreme_window, maximum=True)
+        self.low = RunningExtreme(extreme_window, maximum=False)
+
+        self.rsi_period = rsi_period
+        self.gains = RunningSum(rsi_period - 1)
+        self.losses = RunningSum(rsi_period - 1)
+        self.previous_change = np.nan
+        self.avg_gain = np.nan
+        self.avg_loss = np.nan
+        self.changes = 0
+
+        # Rounded SMA of the longest window, sma_lag bars ago
+        self.sma_history = deque(maxlen=sma_lag + 1)
+
+        self.bars = 0
+        self.last_date = None
+        self.last_close = np.nan
+
+    def update(self, date, close):
+        close = float(close)
+
+        if self.bars > 0:
+            change = close - self.last_close
+
+            # The window sums run one change behind, like stock_screener.rsi
+            if self.bars > 1:
+                self.gains.update(self.previous_change if self.previous_change > 0 else 0.0)
+                self.losses.update(-self.previous_change if self.previous_change < 0 else 0.0)
+            self.previous_change = change
+
+            if not math.isnan(change):
+                self.changes += 1
+                gain, loss = max(change, 0.0), max(-change, 0.0)
+                if self.changes <= self.rsi_period:
+                    # Seeded with the simple average of the first rsi_period changes
+                    weight = self.changes
+                    self.avg_gain = gain if weight == 1 else (self.avg_gain * (weight - 1) + gain) / weight
+                    self.avg_loss = loss if weight == 1 else (self.avg_loss * (weight - 1) + loss) / weight
+                else:
+                    self.avg_gain = (self.avg_gain * (self.rsi_period - 1) + gain) / self.rsi_period
+                    self.avg_loss = (self.avg_loss * (self.rsi_period - 1) + loss) / self.rsi_period
+
+        for running in self.smas.values():
+            running.update(close)
+        self.high.update(close)
+        self.low.update(close)
+        self.sma_history.append(self.sma(max(self.smas)))
+
+        self.bars += 1
+        self.last_date = date
+        self.last_close = close
+
+    def update_many(self, dates, closes):
+        for date, close in zip(dates, closes):
+            self.update(date, close)
+
+    def sma(self, window):
+        return np.round(self.smas[window].mean(), 2)
+
+    def lagged_sma(self):
+        """SMA of the longest window sma_lag bars ago, 0 when the history is too short."""
+        if self.bars < self.sma_history.maxlen:
+            return 0
+        return self.sma_history[0]
+
+    def high_of_window(self):
+        return self.high.value()
+
+    def low_of_window(self):
+        return self.low.value()
+
+    def rsi(self):
+        # Summed from the window itself (O(rsi_period)) so the result is bit-for-bit stock_screener.rsi
+        gains, losses = np.array(self.gains.values), np.array(self.losses.values)
+        smma_up = np.sum(gains[gains > 0]) / self.rsi_period
+        smma_down = np.sum(losses[losses > 0]) / self.rsi_period
+
+        if smma_down == 0:
+            return 100
+
+        return 100 - 100 / (1 + smma_up / smma_down)
+
+    def wilder_rsi(self):
+        if self.changes < self.rsi_period:
+            return np.nan
+        if self.avg_loss == 0:
+            return 100
+
+        return 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+
+    def lookback(self):
+        """Bars needed to rebuild this state from scratch."""
+        return max(max(self.smas) + self.sma_history.maxlen, self.high.window, self.rsi_period) + 1
+
+
+def build_state(df, **kwargs):
+    state = IndicatorState(**kwargs)
+    tail = df.iloc[-state.lookback():]
+
+    state.update_many(tail.index, tail["Adj Close"].values)
+    state.bars = len(df)
+
+    return state
+
+
+def update_state(state, df):
+    """Bring a state up to the last row of df, rebuilding it when df no longer ends the way the state remembers
+    (a restated or replaced history)."""
+    if state is None or state.last_date is None or state.last_date not in df.index:
+        return build_state(df)
+
+    position = df.index.get_loc(state.last_date)
+    if not isinstance(position, int) or position + 1 != state.bars or \
+            df["Adj Close"].iloc[position] != state.last_close:
+        return build_state(df)
+
+    new = df.iloc[position + 1:]
+    state.update_many(new.index, new["Adj Close"].values)
+
+    return state
+
+
+def load_state(symbol, df, market="us"):
+    """Indicator state of a symbol's history, read from and saved back to data/{market}/indicators."""
+    path = state_path(symbol, market)
+
+    state = None
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            state = None
+
+    last_date = None if state is None else state.last_date
+    state = update_state(state, df)
+
+    if state.last_date != last_date:
+        os.makedirs(indicator_directory(market), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            pickle.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    return state
@@ -0,0 +1,94 @@
+import datetime as dt
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import closing
+
+# How long each info type stays fresh before a reload fetches it again.
+info_ttls = {
+    "info": dt.timedelta(days=1),
+    "options": dt.timedelta(days=1),
+    "calendar": dt.timedelta(days=1),
+    "dividends": dt.timedelta(days=7),
+    "actions": dt.timedelta(days=7),
+    "splits": dt.timedelta(days=7),
+    "institutional_holders": dt.timedelta(days=30),
+    "mutualfund_holders": dt.timedelta(days=30),
+    "major_holders": dt.timedelta(days=30),
+}
+
+default_ttl = dt.timedelta(days=1)
+
+# SQLite limits the number of bound parameters per statement.
+query_chunk_size = 500
+
+
+def db_path(market="us"):
+    return f"data/{market}/info/info.db"
+
+
+def connect(market="us"):
+    file_path = db_path(market)
+    if not os.path.exists(os.path.dirname(file_path)):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    conn = sqlite3.connect(file_path, timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS ticker_info (symbol TEXT NOT NULL, type TEXT NOT NULL, "
+                 "fetched_at REAL NOT NULL, payload BLOB NOT NULL, PRIMARY KEY (symbol, type))")
+
+    return conn
+
+
+def get_many(symbols, type_str="info", market="us"):
+    """Return {symbol: (fetched_at, value)} for the symbols stored for this info type."""
+    out = {}
+
+    with closing(connect(market)) as conn:
+        for i in range(0, len(symbols), query_chunk_size):
+            chunk = list(symbols[i:i + query_chunk_size])
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(f"SELECT symbol, fetched_at, payload FROM ticker_info "
+                                f"WHERE type = ? AND symbol IN ({placeholders})", [type_str] + chunk)
+
+            for symbol, fetched_at, payload in rows:
+                out[symbol] = (fetched_at, pickle.loads(payload))
+
+    return out
+
+
+def fetched_at_many(symbols, type_str="info", market="us"):
+    """Return {symbol: fetched_at} without loading the payloads."""
+    out = {}
+
+    with closing(connect(market)) as conn:
+        for i in range(0, len(symbols), query_chunk_size):
+            chunk = list(symbols[i:i + query_chunk_size])
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(f"SELECT symbol, fetched_at FROM ticker_info "
+                                f"WHERE type = ? AND symbol IN ({placeholders})", [type_str] + chunk)
+            out.update(rows)
+
+    return out
+
+
+def put_many(values, type_str="info", market="us", fetched_at=None):
+    """Store {symbol: value}, stamped with fetched_at (seconds since the epoch, default now)."""
+    if fetched_at is None:
+        fetched_at = time.time()
+
+    if not isinstance(fetched_at, dict):
+        fetched_at = {symbol: fetched_at for symbol in values}
+
+    rows = [(symbol, type_str, fetched_at[symbol], pickle.dumps(value)) for symbol, value in values.items()]
+
+    with closing(connect(market)) as conn, conn:
+        conn.executemany("INSERT OR REPLACE INTO ticker_info (symbol, type, fetched_at, payload) VALUES (?, ?, ?, ?)",
+                         rows)
+
+
+def is_stale(fetched_at, type_str="info", now=None):
+    if now is None:
+        now = time.time()
+
+    return now - fetched_at > info_ttls.get(type_str, default_ttl).total_seconds()
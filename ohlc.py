@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import datetime as dt
 import os
-import sys
 
 import matplotlib as mpl
 import matplotlib.dates as mdates
@@ -12,9 +11,10 @@ from matplotlib import style
 from mplfinance.original_flavor import candlestick_ohlc
 
 import data_loader
+import pivot_points
 import sentiment_charts
+import signals
 
-os.chdir(sys.path[0])
 style.use("dark_background")
 
 mpl.rcParams.update({"grid.linestyle": "--", "grid.color": "darkgray"})
@@ -46,68 +46,32 @@ def indicator_chart(symbol, directory, start=dt.datetime(2020, 9, 1), smas=(10,
             df[f"SMA_{sma}"] = df["Adj Close"].rolling(window=sma).mean()
 
         # Bollinger bands
-        bb_period = 15  # moving average
-        std_dev = 2
-        df[f"SMA_{bb_period}"] = df["Adj Close"].rolling(window=bb_period).mean()
-        df["std_dev"] = df["Adj Close"].rolling(window=bb_period).std()
-        df["lower_band"] = df[F"SMA_{bb_period}"] - (std_dev * df["std_dev"])  # upper Bollinger band
-        df["upper_band"] = df[F"SMA_{bb_period}"] + (std_dev * df["std_dev"])  # lower Bollinger band
+        df["SMA_15"], df["lower_band"], df["upper_band"] = signals.bollinger_bands(df["Adj Close"].values)
         df["Date"] = mdates.date2num(df.index)
 
-        # 10.4.4 stochastic
-        period = 10
-        K = 4
-        D = 4
-        df["rol_high"] = df["High"].rolling(window=period).max()  # high of period
-        df["rol_low"] = df["High"].rolling(window=period).min()  # low of period
-        df["stok"] = ((df["Adj Close"] - df["rol_low"]) / (df["rol_high"] - df["rol_low"])) * 100  # 10.1
-        df["K"] = df["stok"].rolling(window=K).mean()  # 10.4
-        df["D"] = df["K"].rolling(window=D).mean()  # 10.4.4
-        df["GD"] = df["K"].rolling(window=D).mean()  # green dots
-        ohlc = []
+        # Green dots (10.4.4 stochastic crossovers) and lower Bollinger band bounces
+        dots = signals.chart_signals(df["High"].values, df["Low"].values, df["Adj Close"].values, start=max(smas))
 
         df = df.iloc[max(smas):]
 
-        green_dot_date = []
-        green_dot = []
-        last_K = 0
-        last_D = 0
-        last_low = 0
-        last_close = 0
-        last_low_bb = 0
+        ohlc = list(zip(df["Date"], df["Open"], df["High"], df["Low"], df["Adj Close"]))
 
-        # Iterate through price history creating candlesticks and green/blue dots
+        for i in np.flatnonzero(dots["green_dot"]):
+            date, high = df["Date"].iloc[i], df["High"].iloc[i]
 
-        for i in df.index:
-            candlestick = df["Date"][i], df["Open"][i], df["High"][i], df["Low"][i], df["Adj Close"][i]
-            ohlc.append(candlestick)
-
-            # Green dot
-            if df["K"][i] > df["D"][i] and last_K < last_D and last_K < 60:
-
-                if 30 in smas and df["High"][i] > df["SMA_30"][i]:
-                    color = "chartreuse"
-                else:
-                    color = "green"
-
-                plt.plot(df["Date"][i], df["High"][i], marker="o", ms=8, ls="", color=color)
-                plt.annotate(f"{df['High'][i]:.2f}", (df["Date"][i], df["High"][i]), fontsize=10)
+            if 30 in smas and high > df["SMA_30"].iloc[i]:
+                color = "chartreuse"
+            else:
+                color = "green"
 
-                green_dot_date.append(i)
-                green_dot.append(df["High"][i])
+            plt.plot(date, high, marker="o", ms=8, ls="", color=color)
+            plt.annotate(f"{high:.2f}", (date, high), fontsize=10)
 
-                # Lower Bollinger Band Bounce
-            if ((last_low < last_low_bb) or (df["Low"][i] < df["lower_band"][i])) and (
-                    df["Adj Close"][i] > last_close and df["Adj Close"][i] > df["lower_band"][i]) and last_K < 60:
-                plt.plot(df["Date"][i], df["Low"][i], marker="o", ms=8, ls="", color="deepskyblue")  # plot blue dot
-                plt.annotate(f"{df['Low'][i]:.2f}", (df["Date"][i], df["Low"][i]), xytext=(-10, 7), fontsize=10)
+        for i in np.flatnonzero(dots["blue_dot"]):
+            date, low = df["Date"].iloc[i], df["Low"].iloc[i]
 
-                # store values
-            last_K = df["K"][i]
-            last_D = df["D"][i]
-            last_low = df["Low"][i]
-            last_close = df["Adj Close"][i]
-            last_low_bb = df["lower_band"][i]
+            plt.plot(date, low, marker="o", ms=8, ls="", color="deepskyblue")  # plot blue dot
+            plt.annotate(f"{low:.2f}", (date, low), xytext=(-10, 7), fontsize=10)
 
         # Plot moving averages and BBands
         sma_colors = ["cyan", "magenta", "yellow", "orange"]
@@ -125,37 +89,7 @@ def indicator_chart(symbol, directory, start=dt.datetime(2020, 9, 1), smas=(10,
         plt.tick_params(axis="x", rotation=45)  # rotate dates for readability
 
         # Pivot Points
-        pivots = []  # Stores pivot values
-        dates = []  # Stores Dates corresponding to those pivot values
-        counter = 0  # Will keep track of whether a certain value is a pivot
-        lastPivot = 0  # Will store the last Pivot value
-
-        value_range = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-        date_range = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-
-        for i in df.index:
-
-            current_max = max(value_range, default=0)
-            value = np.round(df["High"][i], 2)
-
-            value_range = value_range[1:9]
-            date_range = date_range[1:9]
-
-            value_range.append(value)
-            date_range.append(i)
-
-            if current_max == max(value_range, default=0):
-                counter += 1
-            else:
-                counter = 0
-
-            if counter == 5:
-                last_pivot = current_max
-                date_loc = value_range.index(last_pivot)
-                last_date = date_range[date_loc]
-
-                pivots.append(last_pivot)
-                dates.append(last_date)
+        dates, pivots = pivot_points.pivot_highs(df)
 
         timeD = dt.timedelta(days=30)  # Sets length of dotted line on chart
 
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+import data_loader
+import rolling
+
+# Pivot highs: a high that stays the maximum of the trailing window of highs for `confirmation` bars in a row. This
+# is the rule the indicator chart has always drawn, computed with an O(n) sliding max along axis 0, so one call
+# handles a single history or a dates x symbols array of them.
+
+window = 9
+confirmation = 5
+
+
+def find_pivots(highs, window=window, confirmation=confirmation):
+    """Pivots of 1-D or dates x symbols highs (rounded to cents; NaN counts as no high), in confirmation order.
+
+    Returns {"confirmed": row the pivot was confirmed on, "row": row of the high, "value": the high} and, for 2-D
+    highs, "column". The high is the first bar holding the window maximum.
+    """
+    highs = np.asarray(highs, dtype="f8")
+    flat = highs.ndim == 1
+    if flat:
+        highs = highs[:, None]
+
+    # Before the first bar the window is all zeros
+    padded = np.concatenate([np.zeros((window,) + highs.shape[1:]), np.nan_to_num(np.round(highs, 2), nan=0.0)])
+
+    # maxima[t + 1]: max of the window ending at row t; maxima[0]: the empty window
+    maxima = rolling.rolling_max(padded, window)[window - 1:]
+    unchanged = maxima[1:] == maxima[:-1]
+
+    # The confirmation-th unchanged bar in a row (the count restarts after a change), of a window holding a high
+    run = rolling.rolling_sum(unchanged, confirmation) == confirmation
+    confirmed = run & (rolling.shift(unchanged, confirmation, fill_value=0) == 0) & (maxima[1:] > 0)
+
+    # Row-major, so already in confirmation order
+    rows, columns = np.nonzero(confirmed)
+    windows = padded[rows[:, None] + 1 + np.arange(window), columns[:, None]]
+    first_max = np.argmax(windows, axis=1)
+
+    out = {"confirmed": rows, "row": rows + 1 + first_max - window, "value": windows[np.arange(len(rows)), first_max]}
+    if not flat:
+        out["column"] = columns
+
+    return out
+
+
+def pivot_highs(df, window=window, confirmation=confirmation):
+    """(dates, values) of the pivot highs of a price history."""
+    found = find_pivots(df["High"].values, window, confirmation)
+
+    return list(df.index[found["row"]]), list(found["value"])
+
+
+def scan(symbols, market="us", window=window, confirmation=confirmation):
+    """Every pivot of every symbol's saved history as one table, with the histories stacked into one array."""
+    histories = {}
+    for symbol in symbols:
+        df = data_loader.read_price_history(symbol, market)
+        if df is not None and len(df) > 0:
+            histories[symbol] = df
+
+    if not histories:
+        return pd.DataFrame(columns=["Symbol", "Date", "Pivot", "Confirmed"])
+
+    # Shorter histories are padded at the start with NaNs, which find nothing
+    length = max(len(df) for df in histories.values())
+    highs = np.full((length, len(histories)), np.nan)
+    for i, df in enumerate(histories.values()):
+        highs[length - len(df):, i] = df["High"].values
+
+    found = find_pivots(highs, window, confirmation)
+    symbols = list(histories)
+
+    def dates(rows):
+        return [histories[symbols[column]].index[row - length + len(histories[symbols[column]])]
+                for row, column in zip(rows, found["column"])]
+
+    return pd.DataFrame({"Symbol": [symbols[column] for column in found["column"]], "Date": dates(found["row"]),
+                         "Pivot": found["value"], "Confirmed": dates(found["confirmed"])})
@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+
+
+class PriceHistoryCache:
+    """Size-bounded LRU of full price-history frames keyed on (market, symbol).
+
+    Every entry remembers the stamp and last bar of the file it was read from, and is dropped as soon as either no
+    longer matches what is on disk.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, key, stamp, last_bar):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and (entry[0] != stamp or entry[1] != last_bar):
+                del self.entries[key]
+                self.invalidations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, stamp, last_bar, df):
+        if self.maxsize <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (stamp, last_bar, df)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.invalidations = self.evictions = 0
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                    "evictions": self.evictions, "size": len(self.entries)}
+
+    def summary(self):
+        stats = self.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups * 100 if lookups else 0
+
+        return f"Price cache: {stats['hits']} hits, {stats['misses']} misses ({hit_rate:.1f}% hit rate), " \
+               f"{stats['invalidations']} invalidations, {stats['evictions']} evictions, {stats['size']} entries."
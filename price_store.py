@@ -0,0 +1,283 @@
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Price histories are stored as raw NumPy record arrays (one .npy per symbol) so they can be memory-mapped
+# instead of parsed. Dates are stored as datetime64[D], so no date parsing happens on load.
+#
+# Refreshes only rewrite a small {symbol}.tail.npy segment holding the latest bars; its rows replace any rows of the
+# base file from the tail's first date onwards. Once the tail grows past compact_rows it is folded into the base.
+
+price_columns = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+record_dtype = np.dtype([("Date", "datetime64[D]")] + [(col, "f8") for col in price_columns])
+
+
+def symbol_filename(symbol):
+    return "-".join(symbol.lower().strip().split("."))
+
+
+def price_history_directory(market="us"):
+    return f"data/{market}/price_history"
+
+
+def store_path(symbol, market="us"):
+    return f"{price_history_directory(market)}/{symbol_filename(symbol)}.npy"
+
+
+def tail_path(symbol, market="us"):
+    return f"{price_history_directory(market)}/{symbol_filename(symbol)}.tail.npy"
+
+
+def csv_path(symbol, market="us"):
+    return f"{price_history_directory(market)}/{symbol_filename(symbol)}.csv"
+
+
+def to_records(df):
+    records = np.empty(len(df), dtype=record_dtype)
+    records["Date"] = pd.to_datetime(df.index).values.astype("datetime64[D]")
+
+    for col in price_columns:
+        if col in df:
+            records[col] = df[col].values
+        else:
+            records[col] = np.nan
+
+    return records
+
+
+def from_records(records):
+    index = pd.DatetimeIndex(records["Date"].astype("datetime64[ns]"), name="Date")
+    return pd.DataFrame({col: np.array(records[col]) for col in price_columns}, index=index)
+
+
+def write_records(records, file_path):
+    directory = os.path.dirname(file_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # Write to a temporary file and rename over the target, so readers never see a half-written history.
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, records, allow_pickle=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def read_records(file_path, mmap=True):
+    records = np.load(file_path, mmap_mode="r" if mmap else None, allow_pickle=False)
+
+    if records.dtype != record_dtype:
+        raise ValueError(f"Unexpected record layout in {file_path}: {records.dtype}")
+
+    return records
+
+
+def merge_tail(base, tail):
+    if len(tail) == 0:
+        return base
+
+    cut = np.searchsorted(base["Date"], tail["Date"][0])
+    return np.concatenate([base[:cut], tail])
+
+
+def read_stored_records(symbol, market="us"):
+    records = read_records(store_path(symbol, market))
+
+    if os.path.isfile(tail_path(symbol, market)):
+        records = merge_tail(records, read_records(tail_path(symbol, market)))
+
+    return records
+
+
+def write_price_history(df, symbol, market="us"):
+    records = to_records(df)
+
+    # The old tail goes first: were it left by a crash, it would be merged over the new base. A crash in between
+    # only loses the newest bars, which the next refresh downloads again.
+    if os.path.isfile(tail_path(symbol, market)):
+        os.remove(tail_path(symbol, market))
+
+    write_records(records, store_path(symbol, market))
+
+    return records
+
+
+def append_price_history(df, symbol, market="us", compact_rows=256):
+    """Upsert the rows of df (sorted, all newer than any row kept) by rewriting only the tail segment."""
+    new = to_records(df)
+
+    if not os.path.isfile(store_path(symbol, market)):
+        write_records(new, store_path(symbol, market))
+        return
+
+    if len(new) == 0:
+        return
+
+    file_path = tail_path(symbol, market)
+    if os.path.isfile(file_path):
+        tail = read_records(file_path)
+        tail = np.concatenate([tail[tail["Date"] < new["Date"][0]], new])
+    else:
+        tail = new
+
+    if len(tail) > compact_rows:
+        compact(symbol, market, tail=tail)
+    else:
+        write_records(tail, file_path)
+
+
+def compact(symbol, market="us", tail=None):
+    """Fold the tail segment into the base file."""
+    if tail is None:
+        if not os.path.isfile(tail_path(symbol, market)):
+            return
+        tail = read_records(tail_path(symbol, market))
+
+    records = merge_tail(read_records(store_path(symbol, market)), tail)
+    write_records(records, store_path(symbol, market))
+
+    if os.path.isfile(tail_path(symbol, market)):
+        os.remove(tail_path(symbol, market))
+
+
+def migrate_csv(symbol, market="us", remove_csv=False):
+    file_path = csv_path(symbol, market)
+
+    df = pd.read_csv(file_path, index_col=0, parse_dates=True)
+    write_price_history(df, symbol, market)
+
+    if remove_csv:
+        os.remove(file_path)
+
+    return df
+
+
+def has_price_history(symbol, market="us"):
+    return os.path.isfile(store_path(symbol, market)) or os.path.isfile(csv_path(symbol, market))
+
+
+def read_price_history(symbol, market="us"):
+    file_path = store_path(symbol, market)
+
+    if not os.path.isfile(file_path):
+        if os.path.isfile(csv_path(symbol, market)):  # not migrated yet
+            return migrate_csv(symbol, market)
+        return None
+
+    return from_records(read_stored_records(symbol, market))
+
+
+def source_stamp(symbol, market="us"):
+    """Cheap change marker for a symbol's saved history, without reading it."""
+    file_path = store_path(symbol, market)
+
+    if not os.path.isfile(file_path):
+        return None
+
+    stat = os.stat(file_path)
+    stamp = [stat.st_mtime_ns, stat.st_size]
+
+    if os.path.isfile(tail_path(symbol, market)):
+        stat = os.stat(tail_path(symbol, market))
+        stamp += [stat.st_mtime_ns, stat.st_size]
+
+    return stamp
+
+
+def written_at(symbol, market="us"):
+    """When a symbol's saved history was last written (epoch seconds), or None."""
+    paths = [path for path in [store_path(symbol, market), tail_path(symbol, market)] if os.path.isfile(path)]
+    return max(os.path.getmtime(path) for path in paths) if paths else None
+
+
+def last_bar(symbol, market="us"):
+    file_path = store_path(symbol, market)
+
+    if not os.path.isfile(file_path):
+        return None
+
+    for path in [tail_path(symbol, market), file_path]:
+        if os.path.isfile(path):
+            records = read_records(path)
+            if len(records) > 0:
+                return records["Date"][-1]
+
+    return None
+
+
+def saved_symbols(market="us"):
+    """File names (which work as symbols) of every saved price history of a market."""
+    names = set()
+    for pattern in ["*.npy", "*.csv"]:
+        for file_path in glob.glob(f"{price_history_directory(market)}/{pattern}"):
+            name = os.path.basename(file_path).rsplit(".", 1)[0]
+            if not name.endswith(".tail"):
+                names.add(name)
+
+    return sorted(names)
+
+
+def panel_directory(market="us"):
+    return f"{price_history_directory(market)}/all"
+
+
+def write_panel(dates, symbols, values, stamps, market="us"):
+    directory = panel_directory(market)
+
+    write_records(np.asarray(dates, dtype="datetime64[D]"), f"{directory}/dates.npy")
+    write_records(np.ascontiguousarray(values, dtype="f8"), f"{directory}/adj_close.npy")
+
+    # The metadata is written last and records the shape, so a panel interrupted halfway is detected and rebuilt.
+    meta = {"symbols": list(symbols), "stamps": stamps, "shape": list(np.shape(values))}
+    tmp_path = f"{directory}/meta.json.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, f"{directory}/meta.json")
+
+
+def read_panel(market="us"):
+    directory = panel_directory(market)
+
+    if not os.path.isfile(f"{directory}/meta.json"):
+        return None
+
+    with open(f"{directory}/meta.json", "r") as f:
+        meta = json.load(f)
+
+    dates = np.load(f"{directory}/dates.npy", allow_pickle=False)
+    values = np.load(f"{directory}/adj_close.npy", mmap_mode="r", allow_pickle=False)
+
+    if list(values.shape) != meta["shape"] or len(dates) != values.shape[0]:
+        return None
+
+    return dates, meta["symbols"], values, meta["stamps"]
+
+
+def migrate_csv_store(market="us", remove_csv=False):
+    """Convert every price_history/*.csv of a market to the binary store, returning the migrated symbols."""
+    migrated = []
+
+    for file_path in sorted(glob.glob(f"{price_history_directory(market)}/*.csv")):
+        symbol = os.path.splitext(os.path.basename(file_path))[0]
+
+        if os.path.isfile(store_path(symbol, market)) and \
+                os.path.getmtime(store_path(symbol, market)) >= os.path.getmtime(file_path):
+            continue
+
+        try:
+            migrate_csv(symbol, market, remove_csv=remove_csv)
+            migrated.append(symbol)
+        except (ValueError, pd.errors.ParserError) as e:
+            print(f"Could not migrate {file_path}: {e}")
+
+    return migrated
+
+
+if __name__ == "__main__":
+    for m in ["us", "nz"]:
+        print(f"Migrated {len(migrate_csv_store(m))} {m} price histories.")
@@ -0,0 +1,221 @@
+import datetime as dt
+import os
+import pickle
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+import price_store
+
+
+def slice_history(df, start_date, end_date):
+    return df[(df.index >= pd.Timestamp(start_date)) & (df.index < pd.Timestamp(end_date))]
+
+
+def empty_history():
+    return pd.DataFrame({col: pd.Series(dtype="f8") for col in price_store.price_columns},
+                        index=pd.DatetimeIndex([], name="Date"))
+
+
+def merge_ranges(requests, gap=dt.timedelta(days=1)):
+    """Merge overlapping or adjacent (symbol, start, end) ranges of the same symbol into single ranges."""
+    merged = []
+
+    for symbol, start, end in sorted((s, pd.Timestamp(a), pd.Timestamp(b)) for s, a, b in requests):
+        if merged and merged[-1][0] == symbol and start <= merged[-1][2] + gap:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([symbol, start, end])
+
+    return [tuple(r) for r in merged]
+
+
+def fetch_many(fetch, requests):
+    """Answer several (symbol, start, end) ranges with one fetch per merged range of each symbol."""
+    fetched = [(symbol, start, end, fetch(symbol, start, end)) for symbol, start, end in merge_ranges(requests)]
+
+    out = []
+    for symbol, start, end in requests:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        df = next(df for s, a, b, df in fetched if s == symbol and a <= start and end <= b)
+        out.append(slice_history(df, start, end))
+
+    return out
+
+
+class Provider:
+    """Source of price histories and ticker info. Histories cover [start_date, end_date) like Yahoo does."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def history(self, symbol, start_date, end_date):
+        raise NotImplementedError
+
+    def info(self, symbol, type_str="info"):
+        raise NotImplementedError
+
+    def history_many(self, requests):
+        return fetch_many(self.history, requests)
+
+
+class YahooProvider(Provider):
+
+    def history(self, symbol, start_date, end_date):
+        import yfinance as yf
+
+        self.requests += 1
+
+        # yf.download (behind pdr.get_data_yahoo) shares module-level state between calls, Ticker.history does not
+        df = yf.Ticker(symbol).history(start=start_date, end=end_date, auto_adjust=False)
+
+        if df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        df.index.name = "Date"
+
+        return df[[col for col in price_store.price_columns if col in df]]
+
+    def info(self, symbol, type_str="info"):
+        import yfinance as yf
+
+        self.requests += 1
+
+        return getattr(yf.Ticker(symbol), type_str)
+
+
+class ReplayProvider(Provider):
+    """Serves responses recorded by RecordingProvider from disk, without touching the network."""
+
+    def __init__(self, directory="data/replay"):
+        super().__init__()
+        self.directory = directory
+
+    def history_path(self, symbol):
+        return f"{self.directory}/history/{price_store.symbol_filename(symbol)}.npy"
+
+    def info_path(self, symbol, type_str):
+        return f"{self.directory}/info/{type_str}/{price_store.symbol_filename(symbol)}.p"
+
+    def history(self, symbol, start_date, end_date):
+        self.requests += 1
+
+        file_path = self.history_path(symbol)
+        if not os.path.isfile(file_path):
+            return empty_history()
+
+        return slice_history(price_store.from_records(price_store.read_records(file_path)), start_date, end_date)
+
+    def info(self, symbol, type_str="info"):
+        self.requests += 1
+
+        file_path = self.info_path(symbol, type_str)
+        if not os.path.isfile(file_path):
+            raise KeyError(f"No recorded {type_str} for {symbol}.")
+
+        with open(file_path, "rb") as f:
+            return pickle.load(f)
+
+
+class RecordingProvider(Provider):
+    """Passes requests through to another provider and records the responses for a ReplayProvider."""
+
+    def __init__(self, provider, directory="data/replay"):
+        super().__init__()
+        self.provider = provider
+        self.replay = ReplayProvider(directory)
+        self.lock = threading.Lock()
+
+    def history(self, symbol, start_date, end_date):
+        self.requests += 1
+        df = self.provider.history(symbol, start_date, end_date)
+
+        with self.lock:
+            file_path = self.replay.history_path(symbol)
+            records = price_store.to_records(df)
+
+            if os.path.isfile(file_path):
+                old = price_store.read_records(file_path, mmap=False)
+                old = old[~np.isin(old["Date"], records["Date"])]
+                records = np.sort(np.concatenate([old, records]), order="Date")
+
+            price_store.write_records(records, file_path)
+
+        return df
+
+    def info(self, symbol, type_str="info"):
+        self.requests += 1
+        value = self.provider.info(symbol, type_str)
+
+        file_path = self.replay.info_path(symbol, type_str)
+        if not os.path.exists(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        with open(file_path, "wb") as f:
+            pickle.dump(value, f)
+
+        return value
+
+
+class CoalescingProvider(Provider):
+    """Shares one in-flight request between concurrent history requests it covers."""
+
+    def __init__(self, provider):
+        super().__init__()
+        self.provider = provider
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.coalesced = 0
+
+    def history(self, symbol, start_date, end_date):
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+        with self.lock:
+            self.requests += 1
+            pending = self.in_flight.setdefault(symbol, [])
+            shared = next((future for s, e, future in pending if s <= start and end <= e), None)
+
+            if shared is None:
+                entry = (start, end, Future())
+                pending.append(entry)
+            else:
+                self.coalesced += 1
+
+        if shared is not None:
+            return slice_history(shared.result(), start, end)
+
+        future = entry[2]
+        try:
+            df = self.provider.history(symbol, start_date, end_date)
+            future.set_result(df)
+            return df
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                pending.remove(entry)
+                if not pending:
+                    del self.in_flight[symbol]
+
+    def info(self, symbol, type_str="info"):
+        self.requests += 1
+        return self.provider.info(symbol, type_str)
+
+
+def default_provider():
+    """Yahoo, or recorded responses when FINANCE_PROVIDER=replay (directory from FINANCE_REPLAY_DIR)."""
+    name = os.environ.get("FINANCE_PROVIDER", "yahoo")
+    directory = os.environ.get("FINANCE_REPLAY_DIR", "data/replay")
+
+    if name == "replay":
+        provider = ReplayProvider(directory)
+    elif name == "record":
+        provider = RecordingProvider(YahooProvider(), directory)
+    elif name == "yahoo":
+        provider = YahooProvider()
+    else:
+        raise ValueError(f"Unknown provider \"{name}\".")
+
+    return CoalescingProvider(provider)
@@ -0,0 +1,139 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+import price_store
+import rolling
+import trading_calendar
+
+# IBD-style relative strength: a weighted 3/6/9/12-month return, ranked across the whole price panel into a 1-99
+# percentile. The ranking is saved per trading day (the panel's last date), so looking up a symbol is a dict access.
+# US symbols are ranked against the S&P 500; other markets against every history saved for them.
+
+# (bars, weight)
+periods = [(63, 0.4), (126, 0.2), (189, 0.2), (252, 0.2)]
+
+_ratings = {}
+
+
+def weighted_returns(prices):
+    """Weighted 3/6/9/12-month return for every row of a dates x symbols array (NaN without a year of history)."""
+    prices = np.asarray(prices, dtype="f8")
+    out = np.zeros_like(prices)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for bars, weight in periods:
+            out += weight * (prices / rolling.shift(prices, bars) - 1)
+
+    return out
+
+
+def percentile_ranks(values):
+    """Rank each row of a dates x symbols array across its symbols into 1-99 (NaN stays NaN)."""
+    values = np.atleast_2d(np.asarray(values, dtype="f8"))
+    valid = ~np.isnan(values)
+
+    # NaNs sort last, so the ranks of the valid values are 0..count - 1
+    ranks = np.argsort(np.argsort(values, axis=1, kind="stable"), axis=1, kind="stable")
+    counts = valid.sum(axis=1, keepdims=True)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = np.where(counts > 1, 1 + np.round(ranks / (counts - 1) * 98), 99)
+
+    return np.where(valid, out, np.nan)
+
+
+def rs_ratings(prices):
+    """RS ratings of every row of a dates x symbols array."""
+    return percentile_ranks(weighted_returns(prices))
+
+
+def cache_path(day, market="us"):
+    return f"data/{market}/rs_rating/{np.datetime_as_string(np.datetime64(day, 'D'))}.p"
+
+
+def universe(market="us"):
+    """Symbols ranked against each other by default."""
+    return None if market == "us" else price_store.saved_symbols(market)
+
+
+def load_panel(market="us", symbols=None):
+    """Adjusted closes to rank: the market's shared price panel, or for other symbols a panel of their own that is
+    not saved, so it never replaces the shared one."""
+    if symbols is None:
+        return data_loader.all_prices_df(market=market, reload=True, symbols=universe(market))
+
+    closes = {}
+    for symbol in data_loader.remove_duplicates(symbols):
+        df = data_loader.read_price_history(symbol, market)
+        if df is not None and len(df) > 0:
+            closes[symbol] = df["Adj Close"]
+
+    return pd.concat(closes, axis=1, join="outer", sort=True) if closes else pd.DataFrame()
+
+
+def ratings_of(panel):
+    """{symbol file name: RS rating} on the last row of a panel. Symbols without a bar on that date are ranked on
+    their last price."""
+    if len(panel) == 0:
+        return {}
+
+    prices = panel.iloc[-max(bars for bars, _ in periods) - 1:].ffill()
+    last = rs_ratings(prices.values)[-1]
+
+    return {price_store.symbol_filename(symbol): rating
+            for symbol, rating in zip(panel.columns, last) if not np.isnan(rating)}
+
+
+def load_ratings(market="us", symbols=None, reload=False):
+    """{symbol: RS rating} of the market's universe (or of the given symbols, which are ranked every call) as of the
+    last completed session, from that day's cache file or ranked from the price panel on the first call of the day.
+
+    The ranking is saved under the panel's last date, so one made before the day's bars were downloaded is not
+    taken for that day's in later runs. Use reload after refreshing the histories.
+    """
+    if symbols is not None:
+        return ratings_of(load_panel(market, symbols))
+
+    if market != "us" and len(universe(market)) == 0:  # nothing saved to rank yet
+        return {}
+
+    day = trading_calendar.last_completed_session(market)
+    file_path = os.path.abspath(cache_path(day, market))
+
+    if not reload and file_path in _ratings:
+        return _ratings[file_path]
+
+    if not reload and os.path.exists(file_path):
+        with open(file_path, "rb") as f:
+            _ratings[file_path] = pickle.load(f)
+        return _ratings[file_path]
+
+    try:
+        panel = load_panel(market)
+    except OSError as e:
+        # No universe to rank against (e.g. no symbol list yet): no ratings, and no retry until the next day
+        print(f"No RS ratings for {market}: {e}")
+        _ratings[file_path] = {}
+        return _ratings[file_path]
+
+    ratings = ratings_of(panel)
+
+    if len(panel) > 0:
+        saved_path = os.path.abspath(cache_path(panel.index[-1], market))
+        os.makedirs(os.path.dirname(saved_path), exist_ok=True)
+        with open(f"{saved_path}.tmp", "wb") as f:
+            pickle.dump(ratings, f)
+        os.replace(f"{saved_path}.tmp", saved_path)
+
+    # Kept for this process either way, so a lagging panel is not ranked again for every symbol
+    _ratings[file_path] = ratings
+
+    return ratings
+
+
+def rs_rating(symbol, market="us"):
+    return load_ratings(market).get(price_store.symbol_filename(symbol), np.nan)
@@ -0,0 +1,154 @@
+import warnings
+
+import numpy as np
+
+# Trailing-window statistics along axis 0 (time) of 1-D or dates x symbols arrays, so a whole universe is processed
+# in a handful of array operations. Windows end at (and include) each row, like pandas' rolling().
+
+
+def shift(values, periods=1, fill_value=np.nan):
+    values = np.asarray(values, dtype="f8")
+    out = np.full_like(values, fill_value)
+
+    if periods == 0:
+        out[:] = values
+    elif 0 < periods < len(values):
+        out[periods:] = values[:-periods]
+    elif -len(values) < periods < 0:
+        out[:periods] = values[-periods:]
+
+    return out
+
+
+def _window_sums(values, window):
+    cumsum = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    sums = cumsum[1:].copy()
+
+    if window < len(values):
+        sums[window:] -= cumsum[1:len(values) + 1 - window]
+
+    return sums
+
+
+def rolling_count(values, window):
+    return _window_sums(~np.isnan(np.asarray(values, dtype="f8")), window)
+
+
+def rolling_sum(values, window, min_periods=None):
+    """NaNs are skipped; rows with fewer than min_periods (default window) valid values are NaN."""
+    values = np.asarray(values, dtype="f8")
+    min_periods = window if min_periods is None else min_periods
+
+    sums = _window_sums(np.nan_to_num(values, nan=0.0), window)
+    sums[rolling_count(values, window) < max(min_periods, 1)] = np.nan
+
+    return sums
+
+
+def rolling_mean(values, window, min_periods=None):
+    values = np.asarray(values, dtype="f8")
+    min_periods = window if min_periods is None else min_periods
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = rolling_sum(values, window, min_periods) / rolling_count(values, window)
+
+    return means
+
+
+def _rolling_extreme(values, window, min_periods, accumulate, pad):
+    # van Herk/Gil-Werman: running extremes within fixed blocks of `window` rows, forwards and backwards, give the
+    # extreme of any window as the combination of two lookups, in O(n) regardless of the window length.
+    values = np.asarray(values, dtype="f8")
+    n = len(values)
+    min_periods = window if min_periods is None else min_periods
+
+    if n == 0:
+        return values.copy()
+
+    filled = np.where(np.isnan(values), pad, values)
+    total = -(-(n + window - 1) // window) * window
+    padded = np.full((total,) + values.shape[1:], pad)
+    padded[window - 1:window - 1 + n] = filled
+
+    blocks = padded.reshape((total // window, window) + values.shape[1:])
+    forward = accumulate(blocks, axis=1).reshape(padded.shape)
+    backward = np.flip(accumulate(np.flip(blocks, axis=1), axis=1), axis=1).reshape(padded.shape)
+
+    out = accumulate(np.stack([backward[:n], forward[window - 1:window - 1 + n]]), axis=0)[-1]
+    out[rolling_count(values, window) < max(min_periods, 1)] = np.nan
+
+    return out
+
+
+def rolling_max(values, window, min_periods=None):
+    return _rolling_extreme(values, window, min_periods, np.maximum.accumulate, -np.inf)
+
+
+def rolling_min(values, window, min_periods=None):
+    return _rolling_extreme(values, window, min_periods, np.minimum.accumulate, np.inf)
+
+
+def rolling_std(values, window, min_periods=None, ddof=1):
+    values = np.asarray(values, dtype="f8")
+    min_periods = window if min_periods is None else min_periods
+
+    # Variance does not depend on the level, so centre each column first to keep the sums of squares small
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+        centred = values - np.nanmean(values, axis=0)
+
+    count = rolling_count(values, window)
+    sums = rolling_sum(centred, window, min_periods)
+    squares = rolling_sum(centred ** 2, window, min_periods)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = (squares - sums ** 2 / count) / (count - ddof)
+
+    return np.sqrt(np.where(count > ddof, np.maximum(variance, 0), np.nan))
+
+
+def drop_gaps(values):
+    """Each column's valid values moved down to the last rows, in order, with NaN above, so trailing windows run
+    over a symbol's own bars like a per-symbol dropna(). Also returns {column: original rows of its valid values}
+    for the columns that moved (those with a NaN after their first valid value), for restore_gaps.
+    """
+    values = np.asarray(values, dtype="f8")
+    valid = ~np.isnan(values)
+    gapped = np.flatnonzero((np.maximum.accumulate(valid, axis=0) & ~valid).any(axis=0))
+
+    out = values.copy() if len(gapped) else values
+    moved = {}
+    for column in gapped:
+        rows = np.flatnonzero(valid[:, column])
+        out[:, column] = np.nan
+        out[len(values) - len(rows):, column] = values[rows, column]
+        moved[column] = rows
+
+    return out, moved
+
+
+def restore_gaps(values, moved, fill):
+    """Values computed from drop_gaps' result put back on their original rows, with fill on the rows that were NaN."""
+    values = np.asarray(values)
+    out = values.copy() if moved else values
+
+    for column, rows in moved.items():
+        out[:, column] = fill
+        out[rows, column] = values[len(values) - len(rows):, column]
+
+    return out
+
+
+def last_valid_rows(values, rows):
+    """The last `rows` rows of drop_gaps' result, moving only the columns with a NaN among them."""
+    values = np.asarray(values, dtype="f8")
+    tail = values[-rows:]
+
+    gapped = np.flatnonzero(np.isnan(tail).any(axis=0))
+    if len(gapped) == 0:
+        return tail
+
+    tail = tail.copy()
+    tail[:, gapped] = drop_gaps(values[:, gapped])[0][-rows:]
+
+    return tail
@@ -0,0 +1,60 @@
+import os
+import pickle
+
+import info_store
+import price_store
+import trading_calendar
+
+# Screened rows kept between runs, keyed on everything a row depends on: the symbol's saved history (its last bar
+# and source stamp, which changes when a refresh restates that bar), the version (fetched_at) of its info, the
+# screen definition and whether failing symbols are kept. A symbol is only screened again when one of those changes.
+
+
+def cache_path(market="us"):
+    return f"data/{market}/screened/cache.p"
+
+
+def load_cache(market="us"):
+    """{symbol: (key, row)}, empty if there is no readable cache."""
+    file_path = cache_path(market)
+
+    if not os.path.exists(file_path):
+        return {}
+
+    try:
+        with open(file_path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return {}
+
+
+def save_cache(entries, market="us"):
+    file_path = cache_path(market)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    with open(f"{file_path}.tmp", "wb") as f:
+        pickle.dump(entries, f)
+    os.replace(f"{file_path}.tmp", file_path)
+
+
+def row_keys(symbols, market, definition, remove_screened, reload=False, now=None):
+    """{symbol: key} for the symbols whose rows may be cached. Histories missing the last completed session, and
+    with reload info past its TTL, get no key because screening them would download something first."""
+    info_fetched_at = info_store.fetched_at_many([symbol.lower().strip() for symbol in symbols], "info", market)
+    keys = {}
+
+    for symbol in symbols:
+        last_bar = price_store.last_bar(symbol, market)
+        if not trading_calendar.is_up_to_date(last_bar, market, now, price_store.written_at(symbol, market)):
+            continue
+
+        fetched_at = info_fetched_at.get(symbol.lower().strip())
+        if reload and fetched_at is not None and info_store.is_stale(fetched_at, "info"):
+            continue
+
+        # The row is screened from the saved history, so its stamp catches a restated last bar. (simulator and
+        # indicators are handed a frame instead, and key on its last date and close.)
+        keys[symbol] = (str(last_bar), tuple(price_store.source_stamp(symbol, market)), fetched_at, definition,
+                        remove_screened)
+
+    return keys
@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class RowBuffer:
+    """Dict rows collected column by column and materialised into a DataFrame once.
+
+    Columns keep the order they were first seen in; rows missing a column get NaN.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, row):
+        for key in row:
+            if key not in self.columns:
+                self.columns[key] = [np.nan] * self.length
+
+        for key, values in self.columns.items():
+            values.append(row.get(key, np.nan))
+
+        self.length += 1
+
+    def to_frame(self):
+        if self.length == 0:
+            return None
+
+        return pd.DataFrame(self.columns)
+
+
+class CsvRowSink:
+    """Appends batches of rows to a CSV file. A batch bringing new columns (info keys vary by symbol) widens the
+    header, rewriting the rows written so far with the new columns empty."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.columns = None
+
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def write(self, df):
+        first = self.columns is None
+        if first:
+            self.columns = list(df.columns)
+
+        new_columns = [column for column in df.columns if column not in self.columns]
+        if new_columns:
+            # Read back as text, so the rewritten rows are unchanged
+            written = pd.read_csv(self.file_path, dtype=str, keep_default_na=False)
+            self.columns += new_columns
+            written.reindex(columns=self.columns, fill_value="").to_csv(f"{self.file_path}.tmp", index=False)
+            os.replace(f"{self.file_path}.tmp", self.file_path)
+
+        df.reindex(columns=self.columns).to_csv(self.file_path, mode="w" if first else "a", header=first,
+                                                index=False, date_format="%Y-%m-%d")
+
+    def close(self):
+        pass
+
+
+class ParquetRowSink:
+    """Writes batches of rows as row groups of one Parquet file (needs pyarrow), with the first batch's schema.
+    Columns first seen in a later batch cannot be added to it and are dropped, with a warning."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.writer = None
+        self.columns = None
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.columns = list(df.columns)
+            self.writer = pq.ParquetWriter(self.file_path, table.schema)
+        else:
+            dropped = [column for column in df.columns if column not in self.columns]
+            if dropped:
+                print(f"Warning: {self.file_path} has no columns for {', '.join(map(str, dropped))}, dropping them.")
+
+            table = pa.Table.from_pandas(df.reindex(columns=self.columns), schema=self.writer.schema,
+                                         preserve_index=False)
+
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_sink(file_path):
+    if file_path.endswith(".parquet"):
+        return ParquetRowSink(file_path)
+    if file_path.endswith(".csv"):
+        return CsvRowSink(file_path)
+
+    raise ValueError(f"Unsupported sink \"{file_path}\", use a .csv or .parquet path.")
@@ -0,0 +1,239 @@
+import ast
+import json
+import operator
+import warnings
+
+import numpy as np
+
+import relative_strength
+import rolling
+import vector_screener
+
+# A small rule language for screens over a dates x symbols adjusted close array, e.g.
+#
+#     close > sma(150) > sma(200) and rsi(14) > 70
+#
+# Rules are Python expression syntax, restricted to numbers, `close`, the functions below, arithmetic, comparisons
+# (chains included) and and/or/not. Every distinct sub-expression across all the rules of a screen is compiled into
+# one step of a shared plan, so e.g. an SMA used by four rules is computed once.
+
+binary_operators = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+comparison_operators = {ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt, ast.LtE: operator.le,
+                        ast.Eq: operator.eq, ast.NotEq: operator.ne}
+
+
+def _tail(values, rows):
+    return values if np.ndim(values) == 0 else values[-rows:]
+
+
+def _elementwise(function):
+    return lambda prices, rows, *arrays: function(*[_tail(values, rows) for values in arrays])
+
+
+def _sma(prices, rows, n):
+    if rows == 1:
+        return prices[-n:].mean(axis=0, keepdims=True) if len(prices) >= n else np.full(prices[-1:].shape, np.nan)
+    return rolling.rolling_mean(prices[-(rows + n - 1):], n)[-rows:]
+
+
+def _extreme(rolling_function, reduce_function):
+    def extreme(prices, rows, n):
+        if rows == 1:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+                return reduce_function(prices[-n:], axis=0, keepdims=True)
+        return rolling_function(prices[-(rows + n - 1):], n, min_periods=1)[-rows:]
+
+    return extreme
+
+
+# name: (arguments, function of (prices, rows, *arrays, *constants) giving the last `rows` rows, lookback of
+# (*child lookbacks, *constants)). "x" arguments are sub-expressions, "n" arguments are integer constants.
+functions = {
+    "sma": ("n", _sma, lambda n: n),
+    "high": ("n", _extreme(rolling.rolling_max, np.nanmax), lambda n: n),
+    "low": ("n", _extreme(rolling.rolling_min, np.nanmin), lambda n: n),
+    "rsi": ("n", lambda prices, rows, n: vector_screener.rsi(prices[-(rows + n):], n)[-rows:], lambda n: n + 1),
+    "rs_rating": ("", lambda prices, rows: relative_strength.rs_ratings(prices[-(rows + 252):])[-rows:],
+                  lambda: 253),
+    "lag": ("xn", lambda prices, rows, x, n: rolling.shift(x, n)[-rows:], lambda x, n: x + n),
+    "round": ("xn", lambda prices, rows, x, n: np.round(_tail(x, rows), n), lambda x, n: x),
+}
+
+
+class Screen:
+    """Named rules compiled into one plan. definitions name sub-expressions the rules can refer to."""
+
+    def __init__(self, rules, definitions=None):
+        self.rules = dict(rules)
+        self.definitions = {name: self._parse(expression, name) for name, expression in (definitions or {}).items()}
+
+        self.plan = []  # (function, argument slots, extra rows each argument needs)
+        self.lookbacks = []
+        self.slots = {}
+        self.outputs = {name: self._compile(self._parse(expression, name)) for name, expression in self.rules.items()}
+
+        self.lookback = max([self.lookbacks[slot] for slot in self.outputs.values()], default=1)
+
+    def _parse(self, expression, name):
+        try:
+            return ast.parse(expression.strip(), mode="eval").body
+        except SyntaxError as e:
+            raise ValueError(f"Rule {name}: cannot parse \"{expression}\": {e.msg}.")
+
+    def _add(self, key, function, args, lookback, extra_rows=None):
+        if key not in self.slots:
+            self.slots[key] = len(self.plan)
+            self.plan.append((function, args, extra_rows or [0] * len(args)))
+            self.lookbacks.append(lookback)
+
+        return self.slots[key]
+
+    def _compile(self, node):
+        if isinstance(node, ast.Name) and node.id in self.definitions:
+            return self._compile(self.definitions[node.id])
+
+        key = ast.dump(node)
+        if key in self.slots:
+            return self.slots[key]
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and \
+                not isinstance(node.value, bool):
+            value = node.value
+            return self._add(key, lambda prices, rows: value, [], 1)
+
+        if isinstance(node, ast.Name):
+            if node.id != "close":
+                raise ValueError(f"Unknown name \"{node.id}\".")
+            return self._add(key, lambda prices, rows: prices[-rows:], [], 1)
+
+        if isinstance(node, ast.Call):
+            return self._compile_call(node, key)
+
+        if isinstance(node, ast.BinOp) and type(node.op) in binary_operators:
+            args = [self._compile(node.left), self._compile(node.right)]
+            return self._add(key, _elementwise(binary_operators[type(node.op)]), args,
+                             max(self.lookbacks[arg] for arg in args))
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.Not)):
+            arg = self._compile(node.operand)
+            function = np.negative if isinstance(node.op, ast.USub) else np.logical_not
+            return self._add(key, _elementwise(function), [arg], self.lookbacks[arg])
+
+        if isinstance(node, ast.Compare):
+            # a < b < c is (a < b) and (b < c), with b computed once
+            operands = [self._compile(operand) for operand in [node.left] + node.comparators]
+            args = []
+            for op, left, right in zip(node.ops, operands, operands[1:]):
+                if type(op) not in comparison_operators:
+                    raise ValueError(f"Unsupported comparison in \"{ast.unparse(node)}\".")
+                args.append(self._add(f"{type(op).__name__}({left}, {right})",
+                                      _elementwise(comparison_operators[type(op)]),
+                                      [left, right], max(self.lookbacks[left], self.lookbacks[right])))
+            return self._add(key, lambda prices, rows, *conditions: np.logical_and.reduce(conditions), args,
+                             max(self.lookbacks[arg] for arg in args))
+
+        if isinstance(node, ast.BoolOp):
+            args = [self._compile(value) for value in node.values]
+            function = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            return self._add(key, lambda prices, rows, *conditions: function.reduce(conditions), args,
+                             max(self.lookbacks[arg] for arg in args))
+
+        raise ValueError(f"Unsupported expression \"{ast.unparse(node)}\".")
+
+    def _compile_call(self, node, key):
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if name not in functions:
+            raise ValueError(f"Unknown function \"{ast.unparse(node.func)}\".")
+
+        signature, function, lookback = functions[name]
+        if len(node.args) != len(signature) or node.keywords:
+            raise ValueError(f"{name}() takes {len(signature)} positional argument(s).")
+
+        args, constants, lookback_args, extra_rows = [], [], [], []
+        for kind, arg in zip(signature, node.args):
+            if kind == "x":
+                args.append(self._compile(arg))
+                lookback_args.append(self.lookbacks[args[-1]])
+            elif isinstance(arg, ast.Constant) and isinstance(arg.value, int) and arg.value >= 0:
+                constants.append(arg.value)
+                lookback_args.append(arg.value)
+            else:
+                raise ValueError(f"{name}() needs a non-negative integer, not \"{ast.unparse(arg)}\".")
+
+        # lag(x, n) needs n more rows of x than it returns
+        extra_rows = [constants[0] if name == "lag" else 0] * len(args)
+
+        return self._add(key, lambda prices, rows, *arrays: function(prices, rows, *arrays, *constants), args,
+                         lookback(*lookback_args), extra_rows)
+
+    def evaluate(self, prices, last_only=False):
+        """Boolean arrays of every rule for every row of prices, or for its last row only. In the latter case each
+        step only computes the rows its consumers need, from the last `lookback` rows of prices.
+
+        Like vector_screener, windows skip a symbol's gaps and rules fail on the rows it has no price for.
+        """
+        prices = np.asarray(prices, dtype="f8")
+        has_price = ~np.isnan(prices[-1:] if last_only else prices)
+        moved = {}
+        if last_only:
+            prices = rolling.last_valid_rows(prices, self.lookback)
+        else:
+            prices, moved = rolling.drop_gaps(prices)
+
+        # Rows each step has to produce, pushed from the outputs back through the plan
+        rows = [0] * len(self.plan)
+        for slot in self.outputs.values():
+            rows[slot] = 1 if last_only else len(prices)
+        for slot in reversed(range(len(self.plan))):
+            for arg, extra in zip(self.plan[slot][1], self.plan[slot][2]):
+                rows[arg] = max(rows[arg], min(rows[slot] + extra, len(prices)))
+
+        values = []
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for (function, args, _), step_rows in zip(self.plan, rows):
+                values.append(function(prices, step_rows, *[values[arg] for arg in args]))
+
+        out = {}
+        for name, slot in self.outputs.items():
+            result = np.broadcast_to(np.asarray(values[slot], dtype=bool), prices[-rows[slot]:].shape)
+            result = rolling.restore_gaps(result, moved, False) & has_price
+            out[name] = result[-1] if last_only else result
+
+        return out
+
+
+def load_screen(file_path):
+    """Screen from a json file of {"rules": {name: rule}, "definitions": {name: expression}}."""
+    with open(file_path) as f:
+        config = json.load(f)
+
+    return Screen(config["rules"], config.get("definitions"))
+
+
+minervini_definitions = {
+    "sma_50": "round(sma(50), 2)",
+    "sma_150": "round(sma(150), 2)",
+    "sma_200": "round(sma(200), 2)",
+}
+
+minervini_rules = {
+    # Current Price > 150 SMA and > 200 SMA
+    "cond_1": "close > sma_150 > sma_200",
+    # 150 SMA > 200 SMA
+    "cond_2": "sma_150 > sma_200",
+    # 200 SMA trending up for at least 1 month
+    "cond_3": "sma_200 > lag(sma_200, 19)",
+    # 50 SMA > 150 SMA and 150 SMA > 200 SMA
+    "cond_4": "sma_50 > sma_150 > sma_200",
+    # Current Price > 50 SMA
+    "cond_5": "close > sma_50",
+    # Current Price is at least 30% above 52 week low
+    "cond_6": "close >= 1.3 * low(260)",
+    # Current Price is within 25% of 52 week high
+    "cond_7": "close >= 0.75 * high(260)",
+    # RS rating > 70
+    "cond_8": "rsi(14) > 70",
+}
+
+minervini = Screen(minervini_rules, minervini_definitions)
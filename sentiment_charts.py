@@ -18,7 +18,6 @@ import finance_logger
 import generate_html
 
 script_name = os.path.basename(__file__)
-os.chdir(sys.path[0])
 now = dt.datetime.now()
 date_format = "%d/%m/%Y %H:%M:%S"
 datetime_file_format = "%Y_%m_%d_%H_%M_%S"
@@ -359,4 +358,5 @@ def main(debug=False):
 
 
 if __name__ == "__main__":
+    os.chdir(sys.path[0])
     main(debug=False)
@@ -9,20 +9,16 @@ from collections import Counter
 from time import time
 
 import pandas as pd
-import praw
-from matplotlib import style
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
 
 import finance_logger
 
-os.chdir(sys.path[0])
 now = dt.datetime.now()
 date_format = '%d/%m/%Y %H:%M:%S'
 datetime_file_format = '%Y_%m_%d_%H_%M_%S'
 date_hour_file_format = "%Y_%m_%d_%H"
 date_file_format = '%Y_%m_%d'
 regex = re.compile('[^a-zA-Z ]')
-style.use("dark_background")
 labels_dict = {}
 script_name = os.path.basename(__file__)
 words_blacklist_path = "data/sentiment/words_blacklist.txt"
@@ -42,6 +38,8 @@ def analyse_sentiment(debug=False):
             username = auth_list[2]
             subreddit = auth_list[3]
 
+        import praw
+
         reddit = praw.Reddit(client_id=client_id,
                              client_secret=client_secret,
                              user_agent=username)
@@ -161,4 +159,5 @@ def main(debug=False):
 
 
 if __name__ == "__main__":
+    os.chdir(sys.path[0])
     main(debug=False)
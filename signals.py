@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+import data_loader
+import rolling
+
+# The indicator chart's signals as boolean arrays, computed along axis 0 of 1-D histories or dates x symbols
+# arrays: green dots (the stochastic %K crossing above %D from below 60) and blue dots (a bounce off the lower
+# Bollinger band). ohlc plots them, and scan() finds them across a universe without drawing anything.
+
+bb_period = 15
+bb_std_dev = 2
+
+stochastic_period = 10
+stochastic_k = 4
+stochastic_d = 4
+
+# Rows needed before the last one for both signals to be defined
+lookback_rows = 60
+
+
+def bollinger_bands(close, period=bb_period, std_dev=bb_std_dev):
+    """(middle, lower, upper) bands."""
+    middle = rolling.rolling_mean(close, period)
+    width = std_dev * rolling.rolling_std(close, period)
+
+    return middle, middle - width, middle + width
+
+
+def stochastic(high, low, close, period=stochastic_period, k=stochastic_k, d=stochastic_d):
+    """Slow stochastic (%K, %D), e.g. 10.4.4."""
+    rol_high = rolling.rolling_max(high, period)
+    rol_low = rolling.rolling_min(low, period)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stok = (np.asarray(close, dtype="f8") - rol_low) / (rol_high - rol_low) * 100
+
+    K = rolling.rolling_mean(stok, k)
+    return K, rolling.rolling_mean(K, d)
+
+
+def previous(values):
+    # The chart's loop starts from zeros before the first bar
+    return rolling.shift(values, 1, fill_value=0)
+
+
+def green_dots(K, D, threshold=60):
+    """%K crosses above %D, from a %K below threshold."""
+    last_K, last_D = previous(K), previous(D)
+
+    with np.errstate(invalid="ignore"):
+        return (K > D) & (last_K < last_D) & (last_K < threshold)
+
+
+def blue_dots(low, close, lower_band, K, threshold=60):
+    """Close turns up above the lower band after the low (this bar's or the last one's) dipped below it, from a %K
+    below threshold."""
+    low, close = np.asarray(low, dtype="f8"), np.asarray(close, dtype="f8")
+
+    with np.errstate(invalid="ignore"):
+        dipped = (previous(low) < previous(lower_band)) | (low < lower_band)
+        return dipped & (close > previous(close)) & (close > lower_band) & (previous(K) < threshold)
+
+
+def chart_signals(high, low, close, start=0):
+    """Indicators and dots as the indicator chart draws them, from row `start` on (the rows before only feed the
+    rolling windows). Like the chart, the stochastic takes its period low from the highs."""
+    _, lower_band, _ = bollinger_bands(close)
+    K, D = stochastic(high, high, close)
+
+    high, low, close = [np.asarray(values, dtype="f8")[start:] for values in (high, low, close)]
+    lower_band, K, D = lower_band[start:], K[start:], D[start:]
+
+    return {"lower_band": lower_band, "K": K, "D": D, "green_dot": green_dots(K, D),
+            "blue_dot": blue_dots(low, close, lower_band, K)}
+
+
+def scan(symbols, market="us", lookback=lookback_rows):
+    """Green and blue dots on each symbol's last bar, from the last `lookback` bars of the saved histories stacked
+    into one array."""
+    tails = {}
+    for symbol in symbols:
+        df = data_loader.read_price_history(symbol, market)
+        if df is not None and len(df) >= lookback:
+            tails[symbol] = df.iloc[-lookback:]
+
+    if not tails:
+        return pd.DataFrame(columns=["Date", "Close", "green_dot", "blue_dot"]).rename_axis("Symbol")
+
+    def stacked(column):
+        return np.column_stack([df[column].values for df in tails.values()])
+
+    out = chart_signals(stacked("High"), stacked("Low"), stacked("Adj Close"))
+
+    return pd.DataFrame({"Date": [df.index[-1] for df in tails.values()],
+                         "Close": [df["Adj Close"].iloc[-1] for df in tails.values()],
+                         "green_dot": out["green_dot"][-1], "blue_dot": out["blue_dot"][-1]},
+                        index=pd.Index(list(tails), name="Symbol"))
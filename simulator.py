@@ -1,12 +1,14 @@
 import datetime as dt
+import math
 import os
+import pickle
+import warnings
 
 import numpy as np
-import yfinance as yf
+import pandas as pd
 
 import data_loader
-
-yf.pdr_override()
+import price_store
 
 start = dt.datetime(2020, 5, 1)
 now = dt.datetime.now()
@@ -20,63 +22,95 @@ def date_parse(d):
     return dt.datetime.strptime(d, '%Y-%m-%d')
 
 
-def simulate_ema_strategy(df, symbol, market="us", reload=False):
-    df = data_loader.load_price_history(symbol, start, now, market="us", reload=reload)
-
-    directory = f"data/{market}/ema_sim/{start.strftime('%Y-%m-%d')}"
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-    if len(df) == 0:
-        return np.nan
-
-    smas_min = [3, 5, 8, 10, 12, 15]
-    smas_max = [30, 35, 40, 45, 50, 60]
-    smas_used = smas_min + smas_max
-    len_cols = len(df.columns)
-
-    for sma in smas_used:
-        df[f"ema_{sma}"] = np.round(df.loc[:, "Adj Close"].rolling(window=sma).mean(), 2)
-    pos = 0
-    num = 0
-    percent_change = []
-    bp = 0
-    for i in range(len(df)):
-        c_min = np.min(df.iloc[i, len_cols:len_cols + len(smas_min)])
-        c_max = np.max(df.iloc[i, len_cols + len(smas_min):len_cols + len(smas_min) + len(smas_max)])
-        close = df["Adj Close"].iloc[i]
-        if c_min > c_max:
-            if pos == 0:
-                bp = close
-                pos = 1
-        elif c_min < c_max:
-            if pos == 1:
-                pos = 0
-                sp = close
-                pc = (sp / bp - 1) * 100
-                percent_change.append(pc)
-
-        if num >= len(df) and pos == 1:
-            pos = 0
-            sp = close
-            pc = (sp / bp - 1) * 100
-            percent_change.append(pc)
-
-        num += 1
-    gains = 0
-    num_gains = 0
-    losses = 0
-    num_losses = 0
-    total_return = 1
-    for i in percent_change:
-        if i > 0:
-            gains += i
-            num_gains += 1
-        else:
-            losses += i
-            num_losses += 1
-        total_return = total_return * ((i / 100) + 1)
-
-    total_return = round((total_return - 1) * 100, 2)
-
-    return total_return
+smas_min = [3, 5, 8, 10, 12, 15]
+smas_max = [30, 35, 40, 45, 50, 60]
+
+
+def ema_signal(close, fast=smas_min, slow=smas_max):
+    """Min of the fast averages minus max of the slow ones, per bar (NaN until any of each is defined)."""
+    close = pd.Series(np.asarray(close, dtype="f8"))
+
+    def averages(windows):
+        return np.column_stack([np.round(close.rolling(window=window).mean(), 2) for window in windows])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows
+        return np.nanmin(averages(fast), axis=1) - np.nanmax(averages(slow), axis=1)
+
+
+def positions(signal):
+    """1 while long, else 0, for each bar (along axis 0): entered when the signal turns positive, left when it turns
+    negative, and kept through bars where it is zero or NaN."""
+    with np.errstate(invalid="ignore"):
+        direction = np.where(signal > 0, 1, np.where(signal < 0, -1, 0))
+
+    # Carried forward from the last bar with a direction
+    rows = np.arange(len(direction)).reshape((-1,) + (1,) * (direction.ndim - 1))
+    last = np.maximum.accumulate(np.where(direction != 0, rows, 0), axis=0)
+
+    return (np.take_along_axis(direction, last, axis=0) == 1).astype(np.int8)
+
+
+def trade_returns(close, signal):
+    """Percent returns of the closed trades of positions(signal), bought and sold at the close. A position still
+    open at the end is not counted."""
+    close = np.asarray(close, dtype="f8")
+
+    changes = np.diff(positions(signal), prepend=0)
+    buys = np.flatnonzero(changes == 1)
+    sells = np.flatnonzero(changes == -1)
+
+    return (close[sells] / close[buys[:len(sells)]] - 1) * 100
+
+
+def total_return(percent_changes):
+    # Compounded in trade order, like the original loop
+    return round((math.prod(pc / 100 + 1 for pc in percent_changes) - 1) * 100, 2)
+
+
+def cache_path(symbol, market="us", start_date=start):
+    return f"data/{market}/ema_sim/{start_date.strftime('%Y-%m-%d')}/{price_store.symbol_filename(symbol)}.p"
+
+
+def ema_trades(df, symbol, market="us", reload=False, fast=smas_min, slow=smas_max, start_date=start):
+    """Percent returns of the strategy's closed trades on df (a price history, loaded if None) from start_date.
+
+    They are saved per symbol, keyed on the history's last bar and the parameters, and reused while those stay the
+    same.
+    """
+    if df is None:
+        df = data_loader.load_price_history(symbol, market=market, reload=reload)
+
+    history = df["Adj Close"][df.index >= start_date]
+
+    if len(history) == 0:
+        return None
+
+    key = (str(history.index[-1]), float(history.iloc[-1]), len(history), tuple(fast), tuple(slow))
+    file_path = cache_path(symbol, market, start_date)
+
+    if os.path.exists(file_path):
+        try:
+            with open(file_path, "rb") as f:
+                cached_key, trades = pickle.load(f)
+            if cached_key == key and isinstance(trades, np.ndarray):
+                return trades
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            pass
+
+    close = history.values
+    trades = trade_returns(close, ema_signal(close, fast, slow))
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(f"{file_path}.tmp", "wb") as f:
+        pickle.dump((key, trades), f)
+    os.replace(f"{file_path}.tmp", file_path)
+
+    return trades
+
+
+def simulate_ema_strategy(df, symbol, market="us", reload=False, fast=smas_min, slow=smas_max, start_date=start):
+    """Total % return of the strategy on df (a price history, loaded if None) from start_date."""
+    trades = ema_trades(df, symbol, market, reload, fast, slow, start_date)
+
+    return np.nan if trades is None else total_return(trades)
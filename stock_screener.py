@@ -1,13 +1,22 @@
 import datetime as dt
+import hashlib
+import inspect
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 import numpy as np
 import pandas as pd
-import yfinance as yf
 
+import bootstrap
 import data_loader
+import indicators
+import price_store
+import relative_strength
+import screen_cache
+import screen_output
 import simulator
-
-yf.pdr_override()
+import trading_calendar
 
 start_date = dt.datetime(2017, 12, 1)
 end_date = dt.datetime.now()
@@ -35,7 +44,10 @@ date_cols = ["dateShortInterest", "exDividendDate", "lastDividendDate", "lastFis
              "mostRecentQuarter", "nextFiscalYearEnd", "sharesShortPreviousMonthDate"]
 
 
-def rsi(df, time_period=14):
+def rsi(df, time_period=14, state=None):
+    if state is not None and state.rsi_period == time_period:
+        return state.rsi()
+
     adj_close_idx = list(df.columns).index("Adj Close")
 
     up_down = df.iloc[-time_period:-1, adj_close_idx].values - df.iloc[-time_period - 1:-2, adj_close_idx].values
@@ -53,7 +65,7 @@ def rsi(df, time_period=14):
     return rs_rating
 
 
-def screen_stock(symbol, market="us", reload=False, remove_screened=True):
+def screen_stock(symbol, market="us", reload=False, remove_screened=True, info_dict=None):
     print(symbol)
 
     try:
@@ -62,10 +74,10 @@ def screen_stock(symbol, market="us", reload=False, remove_screened=True):
         if df is None:
             raise ValueError
 
-        if not reload and len(df) > 0 and isinstance(df.index[-1], dt.datetime) and not (
-                (end_date.weekday() >= 5 and df.index[-1] >= end_date - dt.timedelta(days=3))
-                or (end_date.weekday() < 5 and df.index[-1] >= end_date - dt.timedelta(days=2))):
-            df = data_loader.load_price_history(symbol, reload=True)
+        if not reload and len(df) > 0 and isinstance(df.index[-1], dt.datetime) and \
+                not trading_calendar.is_up_to_date(df.index[-1], market,
+                                                   written=price_store.written_at(symbol, market)):
+            df = data_loader.load_price_history(symbol, reload=True, market=market)
 
         if df is None or len(df) == 0:
             raise ValueError
@@ -73,27 +85,18 @@ def screen_stock(symbol, market="us", reload=False, remove_screened=True):
         print(f"{symbol} not found.")
         return None
 
-    smas_used = [50, 150, 200]
-    for sma in smas_used:
-        df[f"SMA_{sma}"] = np.round(df["Adj Close"].rolling(window=sma).mean(), 2)
+    state = indicators.load_state(symbol, df, market=market)
 
     current_close = df["Adj Close"].iloc[-1]
-    moving_average_50 = df["SMA_50"].iloc[-1]
-    moving_average_150 = df["SMA_150"].iloc[-1]
-    moving_average_200 = df["SMA_200"].iloc[-1]
-
-    try:
-        low_of_52_week = np.min(df["Adj Close"].iloc[-260:])
-        high_of_52_week = np.max(df["Adj Close"].iloc[-260:])
+    moving_average_50 = state.sma(50)
+    moving_average_150 = state.sma(150)
+    moving_average_200 = state.sma(200)
+    moving_average_200_20 = state.lagged_sma()
 
-        rs_rating = rsi(df)
-    except IndexError:
-        return None
+    low_of_52_week = state.low_of_window()
+    high_of_52_week = state.high_of_window()
 
-    try:
-        moving_average_200_20 = df["SMA_200"].iloc[-20]
-    except IndexError:
-        moving_average_200_20 = 0
+    rs_rating = rsi(df, state=state)
 
     # Condition 1: Current Price > 150 SMA and > 200 SMA
     cond_1 = current_close > moving_average_150 > moving_average_200
@@ -123,7 +126,8 @@ def screen_stock(symbol, market="us", reload=False, remove_screened=True):
     else:
         is_screened_str = "FAIL"
 
-    info_dict = data_loader.load_ticker_info(symbol, type_str="info", reload=reload)
+    if info_dict is None:
+        info_dict = data_loader.load_ticker_info(symbol, market=market, type_str="info", reload=reload)
 
     if info_dict is None:
         info_dict = {}
@@ -144,17 +148,29 @@ def screen_stock(symbol, market="us", reload=False, remove_screened=True):
         elif info_dict[key] is None:
             info_dict[key] = ""
 
+    trades = simulator.ema_trades(df, symbol, market=market, reload=reload)
+    intervals = bootstrap.confidence_intervals([[] if trades is None else trades],
+                                               seed=bootstrap.symbol_seed(symbol))[0]
+
     row = {
         "Security": info_dict["longName"],
         "Symbol": symbol.upper(),
         "Sector": info_dict["sector"],
         "RSI": np.round(rs_rating, 2),
+        "RS Rating": relative_strength.rs_rating(symbol, market),
         "Mark Minervini test": is_screened_str,
         "Current Close": np.round(current_close, 2),
         "div. Rate": info_dict["dividendRate"],
         "div. Yield": info_dict["dividendYield"],
         "Payout Ratio": info_dict["payoutRatio"],
-        "Simulation % Return": simulator.simulate_ema_strategy(df, symbol, market=market, reload=reload),
+        "Simulation % Return": np.nan if trades is None else simulator.total_return(trades),
+        # Bootstrapped 90% intervals of that return and of the max drawdown (negative, so 5% is the deepest), and
+        # how often a resampled trade sequence made money
+        "Simulation 5% Return": np.round(intervals["return low"], 2),
+        "Simulation 95% Return": np.round(intervals["return high"], 2),
+        "Simulation 5% Max Drawdown": np.round(intervals["drawdown low"], 2),
+        "Simulation 95% Max Drawdown": np.round(intervals["drawdown high"], 2),
+        "Simulation P(Return > 0)": np.round(intervals["p positive"], 2),
         "50 Day MA": moving_average_50,
         "150 Day MA": moving_average_150,
         "200 Day MA": moving_average_200,
@@ -173,36 +189,158 @@ def screen_stock(symbol, market="us", reload=False, remove_screened=True):
     return row
 
 
-def screen_stocks(symbols, reload=False, remove_screened=True, save_files=False):
-    out_df = None
+def _screen_chunk(chunk, reload, remove_screened):
+    results = []
 
-    file_path = "out/sheets/nz_screened"
+    for symbol, market, info_dict in chunk:
+        try:
+            row = screen_stock(symbol, market=market, reload=reload, remove_screened=remove_screened,
+                               info_dict=info_dict)
+            results.append((symbol, row, None))
+        except Exception:
+            results.append((symbol, None, traceback.format_exc()))
 
-    for symbol in symbols:
+    return results
+
+
+def screen_rows(tasks, reload=False, remove_screened=True, workers=1, chunks_per_worker=4):
+    """Yield (symbol, row, error) for (symbol, market, info_dict) tasks in input order.
+
+    With workers > 1 the tasks are screened in chunks on a process pool. A failing symbol yields its traceback as
+    the error instead of stopping the batch.
+    """
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        yield from _screen_chunk(tasks, reload, remove_screened)
+        return
+
+    chunk_size = max(1, -(-len(tasks) // (workers * chunks_per_worker)))
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(_screen_chunk, chunks, repeat(reload), repeat(remove_screened)):
+            yield from results
 
-        if symbol.endswith(".nz"):
-            market = "nz"
-        else:
-            market = "us"
 
-        row = screen_stock(symbol, market=market, reload=reload, remove_screened=remove_screened)
-        if row:
-            if out_df is None:
-                out_df = pd.DataFrame(columns=list(row.keys()))
-            out_df = out_df.append(row, ignore_index=True)
+def screen_definition():
+    """Hash of the code a screened row is computed by, so editing it invalidates the cached rows."""
+    sources = [inspect.getsource(func) for func in [rsi, screen_stock, simulator.ema_trades, simulator.ema_signal,
+                                                    simulator.trade_returns, bootstrap.resample]]
 
+    return hashlib.sha1("".join(sources + [inspect.getsource(indicators)]).encode()).hexdigest()
+
+
+def format_screened(out_df):
     for date_col in date_cols:
         try:
             out_df[date_col] = pd.to_datetime(out_df[date_col], unit="s", errors="coerce")
         except:
             pass
 
-    out_df["industry"] = out_df["industry"].apply(lambda x: x.replace("—", "-") if isinstance(x, str) else "")
+    if "industry" in out_df:
+        out_df["industry"] = out_df["industry"].apply(lambda x: x.replace("—", "-") if isinstance(x, str) else "")
+
     cols = list(out_df.columns)
-    cols.remove("longBusinessSummary")
-    cols.append("longBusinessSummary")
+    if "longBusinessSummary" in cols:
+        cols.remove("longBusinessSummary")
+        cols.append("longBusinessSummary")
+
+    return out_df[cols]
+
+
+def screen_stocks(symbols, reload=False, remove_screened=True, save_files=False, workers=1, sink=None, collect=True,
+                  flush_rows=100, cache=True):
+    """Screen symbols into one DataFrame.
+
+    With cache, rows are reused from the last screen for symbols whose saved history, info and screen definition
+    have not changed since (see screen_cache), and only the rest are screened again.
+
+    sink (a .csv/.parquet path or an object with write(df)/close()) receives the rows in batches of flush_rows as
+    they complete; with collect=False nothing else is kept in memory and None is returned.
+    """
+    buffer = screen_output.RowBuffer()
+    pending = screen_output.RowBuffer()
+
+    if isinstance(sink, str):
+        sink = screen_output.open_sink(sink)
+
+    file_path = "out/sheets/nz_screened"
+
+    markets = {symbol: "nz" if symbol.endswith(".nz") else "us" for symbol in symbols}
+
+    # Every row needs its info when nothing is filtered out, so look it all up in one batch.
+    infos = {}
+    if not remove_screened:
+        for market in set(markets.values()):
+            market_symbols = [symbol for symbol in symbols if markets[symbol] == market]
+            infos.update(data_loader.load_ticker_info_many(market_symbols, market=market, reload=reload))
+
+    # Rank the universe once here rather than in every worker, after downloading the day's bars when reloading
+    for market in set(markets.values()):
+        if reload:
+            data_loader.reload_all([symbol for symbol in symbols if markets[symbol] == market], market=market)
+        relative_strength.load_ratings(market, reload=reload)
+
+    entries = {market: {} for market in set(markets.values())}
+    keys = {}
+    if cache:
+        definition = screen_definition()
+        for market in entries:
+            entries[market] = screen_cache.load_cache(market)
+            keys.update(screen_cache.row_keys([symbol for symbol in symbols if markets[symbol] == market], market,
+                                              definition, remove_screened, reload=reload))
+
+    cached = {symbol for symbol in symbols
+              if symbol in keys and entries[markets[symbol]].get(symbol, (None, None))[0] == keys[symbol]}
+    computed = {}
+
+    tasks = [(symbol, markets[symbol], infos.get(symbol.lower().strip()))
+             for symbol in symbols if symbol not in cached]
+    screened = screen_rows(tasks, reload=reload, remove_screened=remove_screened, workers=workers)
+
+    try:
+        for symbol in symbols:
+            if symbol in cached:
+                row, error = entries[markets[symbol]][symbol][1], None
+            else:
+                _, row, error = next(screened)
+                if error is None:
+                    computed[symbol] = row
+
+            if error is not None:
+                print(f"Error screening {symbol}:\n{error}")
+                continue
+
+            if row:
+                if collect:
+                    buffer.append(row)
+
+                if sink is not None:
+                    pending.append(row)
+
+                    if len(pending) >= flush_rows:
+                        sink.write(format_screened(pending.to_frame()))
+                        pending = screen_output.RowBuffer()
+
+        if sink is not None and len(pending) > 0:
+            sink.write(format_screened(pending.to_frame()))
+    finally:
+        if sink is not None:
+            sink.close()
+
+    if cache:
+        for market in entries:
+            new_keys = screen_cache.row_keys([symbol for symbol in computed if markets[symbol] == market], market,
+                                             definition, remove_screened, reload=reload)
+            entries[market].update({symbol: (key, computed[symbol]) for symbol, key in new_keys.items()})
+            if new_keys:
+                screen_cache.save_cache(entries[market], market)
+
+        print(f"Served {len(cached)} of {len(symbols)} rows from the screen cache.")
+
+    if not collect or len(buffer) == 0:
+        return None
 
-    out_df = out_df[cols]
+    out_df = format_screened(buffer.to_frame())
 
     if save_files:
 
@@ -1,10 +1,92 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
+import numpy as np
+import pandas as pd
+
+import backtest
+import bars
+import benchmarks
+import bootstrap
+import bulk_refresh
 import daily_charts
+import data_loader
+import ema_sweep
 import finance_logger
 import generate_html
+import indicators
+import info_store
+import pivot_points
+import price_store
+import providers
+import relative_strength
+import screen_output
+import screen_rules
 import sentiment_charts
 import sentiment_words
+import signals
+import simulator
+import stock_screener
+import trading_calendar
+import vector_screener
+
+
+def fake_price_history(start="2020-01-01", periods=300, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(start, periods=periods, name="Date")
+    close = 100 * np.cumprod(1 + rng.normal(0.001, 0.02, periods))
+    return pd.DataFrame({"Open": close * 0.99, "High": close * 1.01, "Low": close * 0.98, "Close": close,
+                         "Adj Close": close, "Volume": rng.integers(1000, 100000, periods).astype(float)},
+                        index=index)
+
+
+def wait_until(condition, timeout=5):
+    """Poll condition until it holds (True) or timeout seconds pass (False)."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def fake_price_panel(periods=600, symbols=40, seed=0):
+    rng = np.random.default_rng(seed)
+    drift = rng.normal(0.002, 0.002, symbols)
+    prices = 100 * np.cumprod(1 + rng.normal(drift, 0.02, (periods, symbols)), axis=0)
+    prices[:250, 1] = np.nan  # listed later than the others
+    return pd.DataFrame(prices, index=pd.bdate_range("2018-01-01", periods=periods, name="Date"),
+                        columns=[f"s{i}" for i in range(symbols)])
+
+
+def minervini_reference(series):
+    # screen_stock's conditions, computed the original per-symbol way
+    df = series.dropna().to_frame("Adj Close")
+    sma = {window: np.round(df["Adj Close"].rolling(window=window).mean(), 2) for window in [50, 150, 200]}
+    close = df["Adj Close"].iloc[-1]
+    low, high = np.min(df["Adj Close"].iloc[-260:]), np.max(df["Adj Close"].iloc[-260:])
+
+    return [close > sma[150].iloc[-1] > sma[200].iloc[-1], sma[150].iloc[-1] > sma[200].iloc[-1],
+            sma[200].iloc[-1] > sma[200].iloc[-20], sma[50].iloc[-1] > sma[150].iloc[-1] > sma[200].iloc[-1],
+            close > sma[50].iloc[-1], close >= 1.3 * low, close >= 0.75 * high, stock_screener.rsi(df) > 70]
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
 
 
 class TestFinance(unittest.TestCase):
@@ -26,5 +108,721 @@ class TestFinance(unittest.TestCase):
         self.assertTrue(finance_logger.was_successful("generate_html"))
 
 
+class TestPriceStore(TempDirTestCase):
+
+    def test_round_trip(self):
+        df = fake_price_history()
+        price_store.write_price_history(df, "abc.nz", market="nz")
+
+        self.assertTrue(os.path.isfile("data/nz/price_history/abc-nz.npy"))
+        pd.testing.assert_frame_equal(price_store.read_price_history("abc.nz", market="nz"), df, check_freq=False)
+
+    def test_append_and_compact(self):
+        df = fake_price_history()
+        price_store.write_price_history(df.iloc[:200], "abc")
+
+        revised = df.iloc[199:250].copy()
+        revised.iloc[0] *= 1.01  # the saved last bar is replaced by the refreshed one
+        price_store.append_price_history(revised, "abc", compact_rows=100)
+        self.assertEqual(len(price_store.read_records("data/us/price_history/abc.npy")), 200)
+        self.assertEqual(len(price_store.read_records("data/us/price_history/abc.tail.npy")), 51)
+
+        price_store.append_price_history(df.iloc[250:], "abc", compact_rows=100)
+        self.assertFalse(os.path.isfile("data/us/price_history/abc.tail.npy"))
+
+        expected = pd.concat([df.iloc[:199], revised, df.iloc[250:]])
+        pd.testing.assert_frame_equal(price_store.read_price_history("abc"), expected, check_freq=False)
+
+    def test_full_rewrite_drops_the_old_tail_first(self):
+        df = fake_price_history()
+        price_store.write_price_history(df.iloc[:200], "abc")
+        price_store.append_price_history(df.iloc[200:210], "abc")
+
+        removed = []
+        with mock.patch("price_store.write_records", side_effect=lambda *args: removed.append(
+                os.path.isfile("data/us/price_history/abc.tail.npy"))):
+            price_store.write_price_history(df, "abc")
+
+        self.assertEqual(removed, [False])
+
+    def test_refresh_keeps_saved_last_bar_left_out_of_reply(self):
+        df = fake_price_history()
+        price_store.write_price_history(df.iloc[:200], "abc")
+
+        loaded = data_loader.load_price_history("abc", fetch=lambda symbol, start, end: df.iloc[200:])
+
+        pd.testing.assert_frame_equal(loaded, df, check_freq=False)
+        pd.testing.assert_frame_equal(data_loader.read_price_history("abc"), df, check_freq=False)
+        pd.testing.assert_frame_equal(price_store.read_price_history("abc"), df, check_freq=False)
+
+    def test_csv_migration(self):
+        df = fake_price_history()
+        os.makedirs("data/us/price_history")
+        df.reset_index(level=0).to_csv("data/us/price_history/abc.csv", index=False, date_format="%Y-%m-%d")
+
+        self.assertEqual(price_store.migrate_csv_store("us"), ["abc"])
+        loaded = data_loader.load_price_history("abc", start_date=df.index[10], reload=False)
+        pd.testing.assert_frame_equal(loaded, df.iloc[10:], check_freq=False)
+
+
+class TestBulkRefresh(TempDirTestCase):
+
+    def test_reload_all_with_fake_provider(self):
+        history = fake_price_history()
+        price_store.write_price_history(history.iloc[:-5], "abc")
+        calls = []
+
+        def fake_fetch(symbol, start_date, end_date):
+            calls.append((symbol, start_date))
+            if symbol == "bad":
+                raise ConnectionError("no route")
+            if symbol == "flaky" and len([c for c in calls if c[0] == "flaky"]) == 1:
+                raise ConnectionError("timeout")
+            return history[history.index >= start_date]
+
+        report = data_loader.reload_all(["abc", "flaky", "bad", "abc"], start_date=history.index[0], rate=None,
+                                        retries=1, backoff=0, fetch=fake_fetch, workers=3)
+
+        self.assertEqual(sorted(report.succeeded), ["abc", "flaky"])
+        self.assertEqual(list(report.failed), ["bad"])
+        self.assertEqual([start for symbol, start in calls if symbol == "abc"], [history.index[-6]])
+        pd.testing.assert_frame_equal(price_store.read_price_history("abc"), history, check_freq=False)
+
+    def test_token_bucket(self):
+        clock = [0.0]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            clock[0] += seconds
+
+        bucket = bulk_refresh.TokenBucket(2, capacity=1, clock=lambda: clock[0], sleep=sleep)
+        for _ in range(3):
+            bucket.acquire()
+
+        self.assertEqual(waits, [0.5, 0.5])
+
+
+class TestAllPricesDf(TempDirTestCase):
+
+    def test_incremental_panel(self):
+        histories = {symbol: fake_price_history(start=start, periods=50, seed=seed) for seed, (symbol, start) in
+                     enumerate([("aaa", "2020-01-01"), ("bbb", "2020-02-03"), ("ccc", "2020-01-15")])}
+        for symbol, df in histories.items():
+            price_store.write_price_history(df.iloc[:-3], symbol)
+
+        panel = data_loader.all_prices_df(symbols=["aaa", "bbb", "ccc"])
+        self.assertEqual(list(panel.columns), ["aaa", "bbb", "ccc"])
+        self.assertEqual(panel["bbb"].notna().sum(), 47)
+
+        price_store.write_price_history(histories["bbb"], "bbb")
+        panel = data_loader.all_prices_df(symbols=["aaa", "bbb", "ccc"])
+        expected = pd.concat({symbol: df["Adj Close"] for symbol, df in histories.items()}, axis=1)
+        expected.loc[histories["aaa"].index[-3:], "aaa"] = np.nan
+        expected.loc[histories["ccc"].index[-3:], "ccc"] = np.nan
+        expected.index.name = "Date"
+
+        pd.testing.assert_frame_equal(panel, expected.dropna(how="all"), check_freq=False)
+        pd.testing.assert_frame_equal(data_loader.all_prices_df(reload=False), panel, check_freq=False)
+
+
+class TestPriceCache(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        data_loader.history_cache.clear()
+
+    def test_hits_and_invalidation(self):
+        df = fake_price_history()
+        price_store.write_price_history(df.iloc[:-1], "abc")
+
+        data_loader.load_price_history("abc", reload=False)
+        sliced = data_loader.load_price_history("abc", start_date=df.index[100], end_date=df.index[199], reload=False)
+        self.assertEqual(len(sliced), 100)
+        self.assertEqual((data_loader.history_cache.hits, data_loader.history_cache.misses), (1, 1))
+
+        sliced["SMA_50"] = 0  # callers adding columns must not leak into the cached frame
+        price_store.write_price_history(df, "abc")
+        reloaded = data_loader.load_price_history("abc", reload=False)
+
+        self.assertEqual(data_loader.history_cache.invalidations, 1)
+        pd.testing.assert_frame_equal(reloaded, df, check_freq=False)
+
+
+class FakeProvider(providers.Provider):
+
+    def __init__(self, histories, release=None):
+        super().__init__()
+        self.histories = histories
+        self.release = release
+
+    def history(self, symbol, start_date, end_date):
+        self.requests += 1
+        if self.release is not None:
+            self.release.wait(5)
+        return providers.slice_history(self.histories[symbol], start_date, end_date)
+
+    def info(self, symbol, type_str="info"):
+        self.requests += 1
+        return {"symbol": symbol.upper(), "type": type_str}
+
+
+class TestProviders(TempDirTestCase):
+
+    def test_coalescing(self):
+        df = fake_price_history()
+        release = threading.Event()
+        fake = FakeProvider({"abc": df}, release=release)
+        provider = providers.CoalescingProvider(fake)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            try:
+                full = executor.submit(provider.history, "abc", df.index[0], df.index[-1])
+                if not wait_until(lambda: provider.in_flight):
+                    self.fail("the first request never started")
+                part = executor.submit(provider.history, "abc", df.index[10], df.index[20])
+                if not wait_until(lambda: provider.coalesced > 0):
+                    self.fail("the second request was not coalesced")
+            finally:
+                release.set()
+
+        self.assertEqual(fake.requests, 1)
+        pd.testing.assert_frame_equal(part.result(), df.iloc[10:20])
+        self.assertEqual(len(full.result()), len(df) - 1)
+
+    def test_adjacent_ranges_are_merged(self):
+        df = fake_price_history()
+        fake = FakeProvider({"abc": df})
+
+        first, second = fake.history_many([("abc", df.index[0], df.index[50]), ("abc", df.index[50], df.index[80])])
+
+        self.assertEqual(fake.requests, 1)
+        pd.testing.assert_frame_equal(pd.concat([first, second]), df.iloc[:80])
+
+    def test_record_and_replay(self):
+        df = fake_price_history()
+        recorder = providers.RecordingProvider(FakeProvider({"abc.nz": df}), directory="replay")
+        recorder.history("abc.nz", df.index[0], df.index[100])
+        recorder.history("abc.nz", df.index[90], df.index[200])
+        recorder.info("abc.nz")
+
+        replay = providers.ReplayProvider("replay")
+        pd.testing.assert_frame_equal(replay.history("abc.nz", df.index[0], df.index[200]), df.iloc[:200],
+                                      check_freq=False)
+        self.assertEqual(replay.info("abc.nz"), {"symbol": "ABC.NZ", "type": "info"})
+        self.assertEqual(len(replay.history("xyz", df.index[0], df.index[-1])), 0)
+
+
+class TestTickerInfoStore(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.provider = data_loader.provider
+        self.fake = FakeProvider({})
+        data_loader.set_provider(self.fake)
+
+    def tearDown(self):
+        data_loader.set_provider(self.provider)
+        super().tearDown()
+
+    def test_only_missing_or_expired_entries_are_downloaded(self):
+        os.makedirs("data/us/info/info")
+        with open("data/us/info/info/old.json", "w") as f:
+            f.write('{"longName": "Legacy"}')
+
+        infos = data_loader.load_ticker_info_many(["AAA", "bbb", "old"])
+        self.assertEqual(self.fake.requests, 2)
+        self.assertEqual(infos["old"], {"longName": "Legacy"})
+        self.assertEqual(infos["aaa"], {"symbol": "AAA", "type": "info"})
+
+        data_loader.load_ticker_info_many(["aaa", "bbb"], reload=True)
+        self.assertEqual(self.fake.requests, 2)
+
+        info_store.put_many({"aaa": {}}, fetched_at=0)
+        self.assertEqual(data_loader.load_ticker_info("aaa", reload=True), {"symbol": "AAA", "type": "info"})
+        self.assertEqual(self.fake.requests, 3)
+
+
+class TestBars(TempDirTestCase):
+
+    def test_incremental_weekly_and_monthly(self):
+        df = fake_price_history(periods=400)
+        price_store.write_price_history(df.iloc[:203], "abc")
+
+        for timeframe, resample in [("W", data_loader.weekly), ("M", data_loader.monthly)]:
+            pd.testing.assert_frame_equal(bars.load_bars("abc", timeframe), resample(df.iloc[:203]), check_freq=False)
+
+        price_store.append_price_history(df.iloc[202:], "abc")
+        monthly = bars.bars_panel(["abc"], "M")
+        pd.testing.assert_series_equal(monthly["abc"], data_loader.monthly(df)["Adj Close"].rename("abc"),
+                                       check_freq=False)
+        pd.testing.assert_frame_equal(bars.load_bars("abc", "W"), data_loader.weekly(df), check_freq=False)
+
+        # A refresh restating the last daily bar under the same date
+        df.iloc[-1, df.columns.get_loc("Adj Close")] *= 1.1
+        price_store.append_price_history(df.iloc[-1:], "abc")
+        pd.testing.assert_frame_equal(bars.load_bars("abc", "W"), data_loader.weekly(df), check_freq=False)
+
+    def test_multi_period_bars_match_resample(self):
+        df = fake_price_history(periods=400)
+        price_store.write_price_history(df.iloc[:203], "abc")
+
+        for timeframe in ["2W", "5D"]:
+            pd.testing.assert_frame_equal(bars.load_bars("abc", timeframe),
+                                          data_loader.resample_bars(df.iloc[:203], timeframe), check_freq=False)
+
+        price_store.append_price_history(df.iloc[203:], "abc")
+        for timeframe in ["2W", "5D"]:
+            pd.testing.assert_frame_equal(bars.load_bars("abc", timeframe), data_loader.resample_bars(df, timeframe),
+                                          check_freq=False)
+
+
+class TestTradingCalendar(TempDirTestCase):
+
+    def test_sessions(self):
+        us_sessions = trading_calendar.sessions("us")
+        self.assertEqual(((us_sessions >= np.datetime64("2023-01-01")) & (us_sessions < np.datetime64("2024-01-01")))
+                         .sum(), 250)
+        self.assertFalse(trading_calendar.is_session(pd.Timestamp("2024-11-28"), "us"))
+        self.assertFalse(trading_calendar.is_session(pd.Timestamp("2024-06-28"), "nz"))
+        self.assertEqual(trading_calendar.last_session(pd.Timestamp("2021-01-04"), "nz"), np.datetime64("2020-12-31"))
+
+        new_york = trading_calendar.markets["us"]["timezone"]
+        before_close = pd.Timestamp("2024-07-05 15:00", tz=new_york)
+        self.assertEqual(trading_calendar.last_completed_session("us", before_close), np.datetime64("2024-07-03"))
+        self.assertTrue(trading_calendar.is_up_to_date(pd.Timestamp("2024-07-03"), "us", before_close))
+
+    def test_up_to_date_history_skips_download(self):
+        last = pd.Timestamp(trading_calendar.last_completed_session("us"))
+        df = fake_price_history(start=last - pd.Timedelta(days=100), periods=50)
+        df.index = df.index[:-1].append(pd.DatetimeIndex([last], name="Date"))
+        price_store.write_price_history(df, "abc")
+
+        def fetch(symbol, start_date, end_date):
+            raise AssertionError("should not download")
+
+        # Listed long after the default start date, which only binds when given
+        loaded = data_loader.load_price_history("abc", fetch=fetch)
+        self.assertEqual(loaded.index[-1], last)
+        self.assertEqual(data_loader.reload_all(["abc"], fetch=fetch, rate=None).failed, {})
+
+    def test_bar_saved_before_close_is_fetched_again(self):
+        last = pd.Timestamp(trading_calendar.last_completed_session("us"))
+        df = fake_price_history(start=last - pd.Timedelta(days=100), periods=50)
+        df.index = df.index[:-1].append(pd.DatetimeIndex([last], name="Date"))
+        price_store.write_price_history(df, "abc")
+
+        # Saved mid-session, at 11:00 on the day of the last bar
+        mid_session = trading_calendar.session_close(last, "us").replace(hour=11).timestamp()
+        os.utime(price_store.store_path("abc"), (mid_session, mid_session))
+
+        calls = []
+
+        def fetch(symbol, start_date, end_date):
+            calls.append(start_date)
+            return df.iloc[-1:].assign(Close=df["Close"].iloc[-1] + 1)
+
+        loaded = data_loader.load_price_history("abc", start_date=df.index[0], fetch=fetch)
+        self.assertEqual(calls, [last])
+        self.assertEqual(loaded["Close"].iloc[-1], df["Close"].iloc[-1] + 1)
+
+        # A bar dated after the last completed session is still in progress
+        self.assertFalse(trading_calendar.is_up_to_date(last + pd.Timedelta(days=1), "us"))
+
+
+class TestIndicatorState(TempDirTestCase):
+
+    def test_incremental_state_matches_full_recompute(self):
+        df = fake_price_history("2018-01-02", 400, seed=3)
+
+        indicators.load_state("abc", df.iloc[:300])
+        state = None
+        for end in range(301, 401):
+            state = indicators.load_state("abc", df.iloc[:end])
+
+        sma_200 = np.round(df["Adj Close"].rolling(window=200).mean(), 2)
+        self.assertEqual(state.bars, 400)
+        self.assertEqual(state.sma(50), np.round(df["Adj Close"].rolling(window=50).mean(), 2).iloc[-1])
+        self.assertEqual(state.sma(200), sma_200.iloc[-1])
+        self.assertEqual(state.lagged_sma(), sma_200.iloc[-20])
+        self.assertEqual(state.high_of_window(), np.max(df["Adj Close"].iloc[-260:]))
+        self.assertEqual(state.low_of_window(), np.min(df["Adj Close"].iloc[-260:]))
+        self.assertEqual(state.rsi(), stock_screener.rsi(df))
+
+        restated = df.copy()
+        restated["Adj Close"] *= 0.99
+        self.assertEqual(indicators.load_state("abc", restated).high_of_window(),
+                         np.max(restated["Adj Close"].iloc[-260:]))
+
+
+class TestVectorScreener(unittest.TestCase):
+
+    def test_matches_per_symbol_screen(self):
+        panel = fake_price_panel()
+        screened = vector_screener.screen_panel(panel)
+
+        for symbol in panel.columns:
+            expected = minervini_reference(panel[symbol])
+            self.assertEqual(list(screened.loc[symbol, vector_screener.condition_names]), expected, symbol)
+            self.assertEqual(screened.loc[symbol, "pass"], all(expected))
+
+        self.assertGreater(screened["pass"].sum(), 0)
+
+        conditions = vector_screener.minervini_conditions(panel.values)
+        for name in vector_screener.condition_names:
+            np.testing.assert_array_equal(conditions[name][-1], screened[name].values)
+
+    def test_gaps_in_the_panel_are_skipped(self):
+        panel = fake_price_panel()
+        panel.iloc[500, :20] = np.nan  # a date missing for half the symbols
+        panel.iloc[590:595, 3] = np.nan
+        screened = vector_screener.screen_panel(panel)
+
+        for symbol in panel.columns:
+            expected = minervini_reference(panel[symbol])
+            self.assertEqual(list(screened.loc[symbol, vector_screener.condition_names]), expected, symbol)
+
+        self.assertGreater(screened["pass"].sum(), 0)
+
+        passed, _ = vector_screener.historical_screen(panel.values, horizons=())
+        np.testing.assert_array_equal(passed[-1], screened["pass"].values)
+        self.assertFalse(passed[500, :20].any())
+
+        last = screen_rules.minervini.evaluate(panel.values, last_only=True)
+        np.testing.assert_array_equal(np.logical_and.reduce(list(last.values())), screened["pass"].values)
+
+
+class TestHistoricalScreen(unittest.TestCase):
+
+    def test_matches_latest_bar_screen_at_every_date(self):
+        panel = fake_price_panel(periods=400, symbols=8)
+        passed, forward = vector_screener.historical_screen(panel.values, horizons=(5, 21))
+
+        for row in [150, 280, 399]:
+            np.testing.assert_array_equal(passed[row], vector_screener.minervini_mask(panel.values[:row + 1])[0])
+
+        np.testing.assert_allclose(forward[5][:-5], panel.values[5:] / panel.values[:-5] - 1)
+        self.assertTrue(np.isnan(forward[21][-21:]).all())
+
+        rates = vector_screener.hit_rates(passed, forward)
+        self.assertEqual(list(rates.index), [5, 21])
+        self.assertEqual(rates.loc[5, "passes"], (passed & ~np.isnan(forward[5])).sum())
+
+
+class TestRelativeStrength(TempDirTestCase):
+
+    def test_weighted_returns_ranked_into_percentiles(self):
+        prices = fake_price_panel(periods=520, symbols=5).values
+        prices[:, 4] = np.nan
+
+        weighted = relative_strength.weighted_returns(prices)[-1]
+        expected = sum(weight * (prices[-1] / prices[-1 - bars] - 1) for bars, weight in relative_strength.periods)
+        np.testing.assert_allclose(weighted, expected)
+
+        ratings = relative_strength.rs_ratings(prices)[-1]
+        self.assertEqual(sorted(ratings[:4]), [1, 34, 66, 99])
+        self.assertEqual(list(np.argsort(ratings[:4])), list(np.argsort(weighted[:4])))
+        self.assertTrue(np.isnan(ratings[4]))
+
+    def test_given_symbols_are_ranked_without_saving(self):
+        panel = fake_price_panel(periods=520, symbols=3)
+        for symbol in panel.columns:
+            price_store.write_price_history(pd.DataFrame({"Adj Close": panel[symbol]}), symbol)
+        price_store.write_price_history(pd.DataFrame({"Adj Close": panel["s0"].iloc[:-1]}), "s0")  # no last bar
+
+        ratings = relative_strength.load_ratings(symbols=list(panel.columns))
+        self.assertEqual(sorted(ratings.values()), [1, 50, 99])
+
+        self.assertIsNone(price_store.read_panel("us"))
+        self.assertFalse(os.path.exists(os.path.dirname(relative_strength.cache_path(panel.index[-1]))))
+
+    def test_other_markets_ranked_against_their_saved_histories(self):
+        self.assertEqual(relative_strength.load_ratings("nz"), {})
+
+        panel = fake_price_panel(periods=520, symbols=3)
+        for symbol in panel.columns:
+            price_store.write_price_history(pd.DataFrame({"Adj Close": panel[symbol]}), f"{symbol}.nz", "nz")
+
+        ratings = relative_strength.load_ratings("nz")
+        self.assertEqual(sorted(ratings.values()), [1, 50, 99])
+        self.assertEqual(relative_strength.rs_rating(f"{panel.columns[0].upper()}.NZ", "nz"),
+                         ratings[f"{panel.columns[0]}-nz"])
+
+        # Saved under the date the panel ends on, not the last completed session it lags behind
+        self.assertTrue(os.path.exists(relative_strength.cache_path(panel.index[-1], "nz")))
+        day = trading_calendar.last_completed_session("nz")
+        self.assertFalse(os.path.exists(relative_strength.cache_path(day, "nz")))
+
+
+class TestSimulator(unittest.TestCase):
+
+    def test_vectorized_ema_strategy_matches_loop(self):
+        for seed, digits in [(1, 2), (2, 0)]:
+            df = np.round(fake_price_history("2019-01-01", 300, seed=seed)[["Adj Close"]], digits)
+            df.iloc[[40, 41, 200], 0] = np.nan
+            self.assertEqual(benchmarks.ema_strategy_vectorized(df), benchmarks.ema_strategy_loop(df))
+
+    def test_open_position_is_not_counted(self):
+        close = np.array([10.0, 11.0, 12.0, 9.0, 10.0, 15.0])
+        signal = np.array([np.nan, 1.0, 0.0, -1.0, 1.0, np.nan])
+
+        np.testing.assert_allclose(simulator.trade_returns(close, signal), [(9.0 / 11.0 - 1) * 100])
+
+
+class TestSimulatorCache(TempDirTestCase):
+
+    def test_uses_given_history_and_caches_result(self):
+        df = fake_price_history("2019-06-03", 500, seed=5)
+        expected = benchmarks.ema_strategy_loop(df.loc[simulator.start:, ["Adj Close"]])
+
+        with mock.patch("data_loader.load_price_history", side_effect=AssertionError):
+            self.assertEqual(simulator.simulate_ema_strategy(df, "abc.nz", market="nz"), expected)
+            self.assertTrue(os.path.exists(simulator.cache_path("abc.nz", "nz")))
+
+            with mock.patch("simulator.trade_returns", side_effect=AssertionError):
+                self.assertEqual(simulator.simulate_ema_strategy(df, "abc.nz", market="nz"), expected)
+
+            # Other parameters compute again
+            self.assertNotEqual(simulator.simulate_ema_strategy(df, "abc.nz", market="nz", fast=[3]), expected)
+            self.assertEqual(simulator.simulate_ema_strategy(df, "abc.nz", market="nz"), expected)
+
+
+class TestBacktest(unittest.TestCase):
+
+    def test_equity_drifts_between_rebalances_and_pays_costs(self):
+        prices = np.array([[100.0, 100.0], [110.0, 100.0], [121.0, 50.0], [121.0, 50.0]])
+        signals = np.array([[True, True], [True, True], [True, False], [True, False]])
+
+        result = backtest.backtest(prices, signals, rebalance=2, cost=0.01)
+
+        drifted = np.array([0.605, 0.25]) / 0.855
+        turnover = abs(1 - drifted[0]) + drifted[1]
+        np.testing.assert_allclose(result["turnover"], [1, 0, turnover, 0])
+        np.testing.assert_allclose(result["equity"], [0.99, 0.99 * 1.05, 0.99 * 0.855 * (1 - 0.01 * turnover),
+                                                      0.99 * 0.855 * (1 - 0.01 * turnover)])
+        self.assertAlmostEqual(result["drawdown"][2], 0.855 * (1 - 0.01 * turnover) / 1.05 - 1)
+
+    def test_ema_signals_follow_simulator_positions(self):
+        panel = fake_price_panel(periods=300, symbols=3)
+        signals = backtest.ema_signals(panel.values)
+
+        close = panel["s2"].values
+        np.testing.assert_array_equal(signals[:, 2], simulator.positions(simulator.ema_signal(close)) == 1)
+        self.assertEqual(len(backtest.backtest(panel, signals, rebalance="W")), 300)
+
+
+class TestBootstrap(unittest.TestCase):
+
+    def test_resampled_paths_per_trade_list(self):
+        trade_lists = [[2.0, 2.0, 2.0], [10.0], np.random.default_rng(0).normal(1, 10, 40), []]
+        returns, drawdowns = bootstrap.resample(trade_lists, paths=500, seed=1)
+
+        self.assertEqual(returns.shape, (4, 500))
+        np.testing.assert_allclose(returns[0], (1.02 ** 3 - 1) * 100)
+        np.testing.assert_allclose(returns[1], 10)
+        np.testing.assert_allclose(drawdowns[:2], 0)
+        self.assertTrue((drawdowns[2] <= 0).all() and (drawdowns[2] < 0).any())
+
+        intervals = bootstrap.confidence_intervals(trade_lists, paths=500, seed=1)
+        self.assertLess(intervals[2]["return low"], intervals[2]["return high"])
+        self.assertEqual(intervals[1]["p positive"], 1)
+        self.assertTrue(np.isnan(intervals[3]["return low"]))
+        self.assertEqual(intervals, bootstrap.confidence_intervals(trade_lists, paths=500, seed=1))
+
+
+class TestSignals(TempDirTestCase):
+
+    def test_dots_from_shifted_arrays(self):
+        K = np.array([np.nan, 20.0, 30.0, 50.0, 70.0, 65.0, 80.0])
+        D = np.array([np.nan, 25.0, 35.0, 45.0, 60.0, 70.0, 75.0])
+        np.testing.assert_array_equal(signals.green_dots(K, D), [False, False, False, True, False, False, False])
+
+        low = np.array([9.0, 8.0, 9.5, 9.0])
+        close = np.array([10.0, 9.0, 10.0, 9.5])
+        lower_band = np.array([9.5, 9.5, 9.5, 9.5])
+        np.testing.assert_array_equal(signals.blue_dots(low, close, lower_band, np.array([50.0, 50.0, 50.0, 70.0])),
+                                      [True, False, True, False])
+
+    def test_scan_matches_full_history_signals(self):
+        histories = {}
+        for seed in range(6):
+            df = fake_price_history("2020-01-01", 300, seed=seed)
+            df["High"], df["Low"] = df["Adj Close"] * 1.01, df["Adj Close"] * 0.99
+            df.iloc[-1, df.columns.get_loc("Low")] = 0.5 * df["Adj Close"].iloc[-1]  # dip below the band
+            histories[f"s{seed}"] = df
+            price_store.write_price_history(df, f"s{seed}")
+
+        out = signals.scan(list(histories))
+
+        for symbol, df in histories.items():
+            full = signals.chart_signals(df["High"].values, df["Low"].values, df["Adj Close"].values)
+            self.assertEqual(out.loc[symbol, "green_dot"], full["green_dot"][-1])
+            self.assertEqual(out.loc[symbol, "blue_dot"], full["blue_dot"][-1])
+
+
+class TestPivotPoints(TempDirTestCase):
+
+    def test_pivot_confirmed_after_staying_highest(self):
+        highs = np.array([1.0, 2.0, 5.0, 3.0, 3.0, 5.0, 2.0, 2.0, 1.0, 1.0, 1.0, 1.0, 6.0])
+        found = pivot_points.find_pivots(highs)
+
+        # The first 5.0 stays the highest from row 2; the window max is unchanged on rows 3 to 7
+        np.testing.assert_array_equal(found["row"], [2])
+        np.testing.assert_array_equal(found["confirmed"], [7])
+        np.testing.assert_array_equal(found["value"], [5.0])
+
+    def test_scan_matches_single_histories(self):
+        histories = {}
+        for seed, periods in [(0, 300), (1, 200), (2, 250)]:
+            df = fake_price_history("2020-01-01", periods, seed=seed)
+            histories[f"s{seed}"] = df
+            price_store.write_price_history(df, f"s{seed}")
+
+        out = pivot_points.scan(list(histories))
+
+        for symbol, df in histories.items():
+            dates, values = pivot_points.pivot_highs(df)
+            self.assertGreater(len(dates), 0)
+            self.assertEqual(list(out.loc[out["Symbol"] == symbol, "Date"]), dates)
+            self.assertEqual(list(out.loc[out["Symbol"] == symbol, "Pivot"]), values)
+
+
+class TestEmaSweep(unittest.TestCase):
+
+    def test_sweep_matches_simulator(self):
+        panel = fake_price_panel(periods=1200, symbols=4)
+        combos = ema_sweep.combinations([[3, 5, 8], simulator.smas_min], [simulator.smas_max],
+                                        ["2019-01-01", "2020-05-01"])
+
+        results = ema_sweep.sweep(panel, combos)
+        self.assertEqual(len(results), 16)
+
+        for symbol in panel.columns:
+            history = panel[symbol].dropna().loc["2020-05-01":].to_frame("Adj Close")
+            row = results[(results["symbol"] == symbol) & (results["fast"] == "3,5,8,10,12,15") &
+                          (results["start"] == "2020-05-01")]
+            self.assertEqual(row["total return"].iloc[0], benchmarks.ema_strategy_loop(history))
+
+        pd.testing.assert_frame_equal(ema_sweep.sweep(panel, combos, workers=2), results)
+        self.assertEqual(list(ema_sweep.summary(results)["symbols"]), [4] * 4)
+
+
+class TestScreenRules(unittest.TestCase):
+
+    def test_minervini_rules_match_vector_screener(self):
+        prices = fake_price_panel(periods=400, symbols=30).values
+
+        expected = vector_screener.minervini_conditions(prices)
+        for name, values in screen_rules.minervini.evaluate(prices).items():
+            np.testing.assert_array_equal(values, expected[name])
+
+        last = screen_rules.minervini.evaluate(prices, last_only=True)
+        np.testing.assert_array_equal(np.logical_and.reduce(list(last.values())),
+                                      vector_screener.minervini_mask(prices)[0])
+
+    def test_shared_subexpressions_compile_once(self):
+        screen = screen_rules.Screen({"a": "close > sma(150) > sma(200) and rsi(14) > 70",
+                                      "b": "sma(150) > sma(200)"})
+        self.assertEqual(sum(key.startswith("Call(func=Name(id='sma'") for key in screen.slots), 2)
+        # b only adds the step combining the comparison already compiled for a
+        self.assertEqual(len(screen.plan),
+                         len(screen_rules.Screen({"a": "close > sma(150) > sma(200) and rsi(14) > 70"}).plan) + 1)
+
+        with self.assertRaises(ValueError):
+            screen_rules.Screen({"a": "sma(close) > 1"})
+
+
+class TestScreenStocks(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.provider = data_loader.provider
+        data_loader.set_provider(FakeProvider({}))
+
+        last = pd.Timestamp(trading_calendar.last_completed_session("us"))
+        panel = fake_price_panel(periods=400, symbols=6)
+        panel.index = pd.bdate_range(end=last, periods=len(panel), name="Date")
+        panel.loc[panel.index[-1]] = panel.iloc[-2]
+        for symbol in panel.columns:
+            price_store.write_price_history(pd.DataFrame({"Adj Close": panel[symbol], "Close": panel[symbol],
+                                                          "Volume": 1000.0}).dropna(), symbol)
+
+        self.symbols = list(panel.columns) + ["missing"]
+        info = {symbol: {"longName": symbol.upper(), "industry": "Software—Application", "longBusinessSummary": ""}
+                for symbol in self.symbols}
+        info_store.put_many(info)
+
+    def tearDown(self):
+        data_loader.set_provider(self.provider)
+        super().tearDown()
+
+    def test_process_pool_matches_sequential(self):
+        sequential = stock_screener.screen_stocks(self.symbols, remove_screened=False)
+        parallel = stock_screener.screen_stocks(self.symbols, remove_screened=False, workers=2, cache=False)
+
+        self.assertEqual(list(sequential["Symbol"]), [symbol.upper() for symbol in self.symbols[:-1]])
+        pd.testing.assert_frame_equal(sequential, parallel)
+
+        drawdowns = sequential[["Simulation 5% Max Drawdown", "Simulation 95% Max Drawdown"]].dropna()
+        self.assertGreater(len(drawdowns), 0)
+        self.assertTrue((drawdowns.iloc[:, 0] <= drawdowns.iloc[:, 1]).all() and (drawdowns.iloc[:, 1] <= 0).all())
+
+    def test_unchanged_rows_are_served_from_cache(self):
+        first = stock_screener.screen_stocks(self.symbols, remove_screened=False)
+
+        screened = []
+        screen_chunk = stock_screener._screen_chunk
+
+        def counting_screen_chunk(chunk, *args):
+            screened.extend(symbol for symbol, _, _ in chunk)
+            return screen_chunk(chunk, *args)
+
+        with mock.patch("stock_screener._screen_chunk", counting_screen_chunk):
+            pd.testing.assert_frame_equal(stock_screener.screen_stocks(self.symbols, remove_screened=False), first)
+            # "missing" has no history, so it is never cached
+            self.assertEqual(screened, ["missing"])
+
+            info_store.put_many({self.symbols[0]: {"longName": "Renamed"}})
+            again = stock_screener.screen_stocks(self.symbols, remove_screened=False)
+
+        self.assertEqual(screened, ["missing", self.symbols[0], "missing"])
+        self.assertEqual(again["Security"].iloc[0], "Renamed")
+
+        # A refresh restating the last bar under the same date
+        restated = price_store.read_price_history(self.symbols[1]).iloc[-1:]
+        restated = restated.assign(**{"Adj Close": restated["Adj Close"] * 1.1, "Close": restated["Close"] * 1.1})
+        price_store.append_price_history(restated, self.symbols[1])
+
+        with mock.patch("stock_screener._screen_chunk", counting_screen_chunk):
+            final = stock_screener.screen_stocks(self.symbols, remove_screened=False)
+
+        self.assertEqual(screened[3:], [self.symbols[1], "missing"])
+        self.assertAlmostEqual(final["Current Close"].iloc[1], round(restated["Adj Close"].iloc[-1], 2))
+
+    def test_csv_sink_streams_batches(self):
+        collected = stock_screener.screen_stocks(self.symbols, remove_screened=False, sink="screened.csv",
+                                                 flush_rows=4)
+        streamed = pd.read_csv("screened.csv", keep_default_na=False, na_values=[""])
+
+        self.assertEqual(list(streamed.columns), list(collected.columns))
+        self.assertEqual(list(streamed["Symbol"]), list(collected["Symbol"]))
+        np.testing.assert_allclose(streamed["Current Close"], collected["Current Close"])
+        self.assertIsNone(stock_screener.screen_stocks(self.symbols, remove_screened=False, sink="again.csv",
+                                                       collect=False))
+
+    def test_csv_sink_widens_header_for_new_columns(self):
+        rows = [{"Symbol": "A", "Sector": "Tech"}, {"Symbol": "B", "beta": 1.5}, {"Symbol": "C", "Sector": ""}]
+        sink = screen_output.CsvRowSink("rows.csv")
+        for row in rows:
+            buffer = screen_output.RowBuffer()
+            buffer.append(row)
+            sink.write(buffer.to_frame())
+
+        streamed = pd.read_csv("rows.csv", keep_default_na=False, na_values=[""])
+        self.assertEqual(list(streamed.columns), ["Symbol", "Sector", "beta"])
+        self.assertEqual(list(streamed["beta"].fillna(0)), [0, 1.5, 0])
+        self.assertEqual(list(streamed["Sector"].fillna("")), ["Tech", "", ""])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,163 @@
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from dateutil.easter import easter
+
+# Exchange trading calendars precomputed into day-indexed arrays, so "what was the last completed session?" is a
+# single array lookup.
+
+first_year = 1990
+last_year = dt.date.today().year + 2
+
+markets = {
+    "us": {"timezone": ZoneInfo("America/New_York"), "close": dt.time(16, 0)},
+    "nz": {"timezone": ZoneInfo("Pacific/Auckland"), "close": dt.time(16, 45)},
+}
+
+# Unscheduled NYSE closures
+us_special_closures = [dt.date(2001, 9, 11), dt.date(2001, 9, 12), dt.date(2001, 9, 13), dt.date(2001, 9, 14),
+                       dt.date(2004, 6, 11), dt.date(2007, 1, 2), dt.date(2012, 10, 29), dt.date(2012, 10, 30),
+                       dt.date(2018, 12, 5), dt.date(2025, 1, 9)]
+
+nz_matariki = [dt.date(2022, 6, 24), dt.date(2023, 7, 14), dt.date(2024, 6, 28), dt.date(2025, 6, 20),
+               dt.date(2026, 7, 10), dt.date(2027, 6, 25), dt.date(2028, 7, 14), dt.date(2029, 7, 6),
+               dt.date(2030, 6, 21), dt.date(2031, 7, 11), dt.date(2032, 7, 2), dt.date(2033, 6, 24),
+               dt.date(2034, 7, 7), dt.date(2035, 6, 29)]
+
+_calendars = {}
+
+
+def nth_weekday(year, month, weekday, n):
+    """n-th (1-based, or -1 for last) weekday (Monday=0) of a month."""
+    if n > 0:
+        first = dt.date(year, month, 1)
+        return first + dt.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+    last = dt.date(year + month // 12, month % 12 + 1, 1) - dt.timedelta(days=1)
+    return last - dt.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def us_observed(day):
+    if day.weekday() == 5:
+        return day - dt.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + dt.timedelta(days=1)
+    return day
+
+
+def mondayised(days):
+    """Move holidays falling on a weekend to the following weekdays that are not already holidays."""
+    out = []
+
+    for day in days:
+        while day.weekday() >= 5 or day in out:
+            day += dt.timedelta(days=1)
+        out.append(day)
+
+    return out
+
+
+def us_holidays(year):
+    holidays = [nth_weekday(year, 1, 0, 3), nth_weekday(year, 2, 0, 3), easter(year) - dt.timedelta(days=2),
+                nth_weekday(year, 5, 0, -1), us_observed(dt.date(year, 7, 4)), nth_weekday(year, 9, 0, 1),
+                nth_weekday(year, 11, 3, 4), us_observed(dt.date(year, 12, 25))]
+
+    if dt.date(year, 1, 1).weekday() != 5:  # not moved back into the previous year when on a Saturday
+        holidays.append(us_observed(dt.date(year, 1, 1)))
+    if year >= 2022:
+        holidays.append(us_observed(dt.date(year, 6, 19)))
+
+    return holidays + [day for day in us_special_closures if day.year == year]
+
+
+def nz_holidays(year):
+    holidays = mondayised([dt.date(year, 1, 1), dt.date(year, 1, 2)]) + \
+               mondayised([dt.date(year, 12, 25), dt.date(year, 12, 26)])
+    holidays += [easter(year) - dt.timedelta(days=2), easter(year) + dt.timedelta(days=1),
+                 nth_weekday(year, 6, 0, 1), nth_weekday(year, 10, 0, 4)]
+
+    waitangi, anzac = dt.date(year, 2, 6), dt.date(year, 4, 25)
+    holidays.append(mondayised([waitangi])[0] if year >= 2014 else waitangi)
+    holidays.append(mondayised([anzac])[0] if year >= 2015 else anzac)
+
+    return holidays + [day for day in nz_matariki if day.year == year]
+
+
+holiday_rules = {"us": us_holidays, "nz": nz_holidays}
+
+
+def _calendar(market):
+    if market not in _calendars:
+        start = np.datetime64(f"{first_year}-01-01")
+        days = np.arange(start, np.datetime64(f"{last_year + 1}-01-01"))
+
+        holidays = [day for year in range(first_year, last_year + 1) for day in holiday_rules[market](year)]
+        is_session = np.is_busday(days, holidays=holidays)
+
+        # last_session[i]: index into sessions of the last session on or before day i (-1 if none)
+        last_session = np.cumsum(is_session) - 1
+
+        _calendars[market] = {"start": start, "days": len(days), "sessions": days[is_session],
+                              "is_session": is_session, "last_session": last_session}
+
+    return _calendars[market]
+
+
+def sessions(market="us"):
+    return _calendar(market)["sessions"]
+
+
+def _day_offset(calendar, day):
+    offset = int((np.datetime64(day, "D") - calendar["start"]).astype(int))
+
+    if not 0 <= offset < calendar["days"]:
+        raise ValueError(f"{day} is outside the precomputed calendar ({first_year}-{last_year}).")
+
+    return offset
+
+
+def is_session(day, market="us"):
+    calendar = _calendar(market)
+    return bool(calendar["is_session"][_day_offset(calendar, day)])
+
+
+def last_session(day, market="us"):
+    """Last session on or before the given date."""
+    calendar = _calendar(market)
+    i = calendar["last_session"][_day_offset(calendar, day)]
+    return calendar["sessions"][i] if i >= 0 else None
+
+
+def last_completed_session(market="us", now=None):
+    """Most recent session that has closed, as seen from `now` (naive datetimes are taken as local time)."""
+    now = (now or dt.datetime.now()).astimezone(markets[market]["timezone"])
+    today = np.datetime64(now.date(), "D")
+
+    if now.time() >= markets[market]["close"]:
+        return last_session(today, market)
+
+    return last_session(today - 1, market)
+
+
+def session_close(session, market="us"):
+    """Closing time of a session, as an aware datetime."""
+    day = np.datetime64(session, "D").astype(dt.date)
+    return dt.datetime.combine(day, markets[market]["close"], tzinfo=markets[market]["timezone"])
+
+
+def is_up_to_date(last_bar, market="us", now=None, written=None):
+    """Whether a history ending at last_bar holds the last completed session, complete: a bar dated after it is
+    still in progress, and so is one written (epoch seconds, e.g. price_store.written_at) before its close."""
+    if market not in markets or last_bar is None:
+        return False
+
+    try:
+        session = last_completed_session(market, now)
+    except ValueError:
+        return False
+
+    if session is None or np.datetime64(last_bar, "D") != session:
+        return False
+
+    return written is None or written >= session_close(session, market).timestamp()
@@ -0,0 +1,173 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+import rolling
+
+# The Minervini trend template of stock_screener.screen_stock, evaluated for a whole dates x symbols adjusted close
+# array at once instead of one DataFrame per symbol. The panel is an outer join, so a symbol can miss dates the
+# others have; its windows skip those gaps as its own history does, and it fails on the dates it has no bar for.
+
+condition_names = ["cond_1", "cond_2", "cond_3", "cond_4", "cond_5", "cond_6", "cond_7", "cond_8"]
+
+# Rows needed to evaluate the last row: SMA_200 as of 19 bars earlier, and the 260-bar low/high.
+lookback_rows = 280
+
+
+def rsi(prices, time_period=14):
+    """stock_screener.rsi for every row: the time_period - 1 price changes up to the previous bar."""
+    changes = np.diff(prices, axis=0, prepend=np.nan)
+
+    up = rolling.shift(rolling.rolling_sum(np.where(changes > 0, changes, 0), time_period - 1), 1)
+    down = -rolling.shift(rolling.rolling_sum(np.where(changes < 0, changes, 0), time_period - 1), 1)
+
+    smma_up = up / time_period
+    smma_down = down / time_period
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rs_rating = 100 - 100 / (1 + smma_up / smma_down)
+
+    return np.where(smma_down == 0, 100, rs_rating)
+
+
+def _conditions(prices, sma_50, sma_150, sma_200, sma_200_20, low_of_52_week, high_of_52_week, rs_rating):
+    with np.errstate(invalid="ignore"):
+        return {
+            "cond_1": (prices > sma_150) & (sma_150 > sma_200),
+            "cond_2": sma_150 > sma_200,
+            "cond_3": sma_200 > sma_200_20,
+            "cond_4": (sma_50 > sma_150) & (sma_150 > sma_200),
+            "cond_5": prices > sma_50,
+            "cond_6": prices >= 1.3 * low_of_52_week,
+            "cond_7": prices >= 0.75 * high_of_52_week,
+            "cond_8": rs_rating > 70,
+        }
+
+
+def minervini_conditions(prices):
+    """Boolean arrays (same shape as prices) of the eight conditions for every row of a dates x symbols array."""
+    has_bar = ~np.isnan(np.asarray(prices, dtype="f8"))
+    prices, moved = rolling.drop_gaps(prices)
+
+    sma_200 = np.round(rolling.rolling_mean(prices, 200), 2)
+
+    conditions = _conditions(prices,
+                             np.round(rolling.rolling_mean(prices, 50), 2),
+                             np.round(rolling.rolling_mean(prices, 150), 2),
+                             sma_200,
+                             rolling.shift(sma_200, 19),
+                             rolling.rolling_min(prices, 260, min_periods=1),
+                             rolling.rolling_max(prices, 260, min_periods=1),
+                             rsi(prices))
+
+    return {name: rolling.restore_gaps(values, moved, False) & has_bar for name, values in conditions.items()}
+
+
+def minervini_mask(prices):
+    """Pass mask and per-condition breakdown for the last row of a dates x symbols array.
+
+    Only the windows ending at the last row are reduced, so this stays cheap for very wide universes.
+    """
+    prices = np.asarray(prices, dtype="f8")
+    has_bar = ~np.isnan(prices[-1])
+    prices = rolling.last_valid_rows(prices, lookback_rows)
+    n = len(prices)
+
+    def sma(window, end=n):
+        if end < window:
+            return np.full(prices.shape[1:], np.nan)
+        return np.round(prices[end - window:end].mean(axis=0), 2)
+
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+        low_of_52_week = np.nanmin(prices[-260:], axis=0)
+        high_of_52_week = np.nanmax(prices[-260:], axis=0)
+
+    breakdown = _conditions(prices[-1], sma(50), sma(150), sma(200), sma(200, n - 19), low_of_52_week,
+                            high_of_52_week, rsi(prices[-15:])[-1])
+    breakdown = {name: values & has_bar for name, values in breakdown.items()}
+
+    return np.logical_and.reduce(list(breakdown.values())), breakdown
+
+
+def forward_returns(prices, horizon):
+    """Return from each row to horizon rows later (NaN where the history ends first)."""
+    prices = np.asarray(prices, dtype="f8")
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return rolling.shift(prices, -horizon) / prices - 1
+
+
+def historical_screen(prices, horizons=(5, 21, 63), screen=None):
+    """Point-in-time screen of every row of a dates x symbols array.
+
+    Returns the dates x symbols boolean pass matrix (Minervini by default, or a screen_rules.Screen) and
+    {horizon: forward returns}, both aligned with prices.
+    """
+    prices = np.asarray(prices, dtype="f8")
+    conditions = minervini_conditions(prices) if screen is None else screen.evaluate(prices)
+
+    passed = np.logical_and.reduce(list(conditions.values()))
+
+    return passed, {horizon: forward_returns(prices, horizon) for horizon in horizons}
+
+
+def hit_rates(passed, forward):
+    """Per horizon: the number of passes with a known forward return, the share of them that rose, and their mean
+    return next to the mean return of every (symbol, date) as the baseline."""
+    passed = np.asarray(passed)
+    rows = []
+
+    for horizon, returns in forward.items():
+        returns = np.asarray(returns)
+        known = ~np.isnan(returns)
+        hits = returns[passed & known]
+
+        rows.append({"horizon": horizon, "passes": len(hits),
+                     "hit rate": np.mean(hits > 0) if len(hits) else np.nan,
+                     "mean return": np.mean(hits) if len(hits) else np.nan,
+                     "baseline mean return": np.mean(returns[known]) if known.any() else np.nan})
+
+    return pd.DataFrame(rows).set_index("horizon")
+
+
+def screen_history(market="us", horizons=(5, 21, 63), symbols=None, reload=False, screen=None):
+    """historical_screen of the price panel, as DataFrames indexed like it."""
+    panel = data_loader.all_prices_df(market=market, reload=reload, symbols=symbols)
+
+    if symbols is not None and not reload:
+        panel = panel[[symbol for symbol in symbols if symbol in panel]]
+
+    passed, forward = historical_screen(panel.values, horizons, screen)
+
+    def frame(values):
+        return pd.DataFrame(values, index=panel.index, columns=panel.columns)
+
+    return frame(passed), {horizon: frame(returns) for horizon, returns in forward.items()}
+
+
+def screen_panel(panel, screen=None):
+    """Screen of the last row of an all_prices_df-style panel, one row per symbol: the Minervini template by
+    default, or a screen_rules.Screen."""
+    if screen is None:
+        mask, breakdown = minervini_mask(panel.values)
+    else:
+        breakdown = screen.evaluate(panel.values, last_only=True)
+        mask = np.logical_and.reduce(list(breakdown.values()))
+
+    out = pd.DataFrame(breakdown, index=panel.columns)
+    out["pass"] = mask
+    out.index.name = "Symbol"
+
+    return out
+
+
+def screen_universe(market="us", symbols=None, reload=False, screen=None):
+    panel = data_loader.all_prices_df(market=market, reload=reload, symbols=symbols)
+
+    if symbols is not None and not reload:
+        panel = panel[[symbol for symbol in symbols if symbol in panel]]
+
+    return screen_panel(panel, screen)